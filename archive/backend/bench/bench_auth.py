@@ -0,0 +1,122 @@
+#
+# Benchmark of the per-request authentication overhead of the backend.
+#
+# Compares, for HS256 and RS256 tokens:
+#   - flask_jwt_extended: @jwt_required() + role check on get_jwt_identity(), blocklist query per request
+#   - role_required: token_auth fast path (claims cached per token, blocklist re-checked periodically)
+# The blocklist lives in an in-memory SQLite database standing in for Postgres.
+#
+#   python bench/bench_auth.py [--requests 5000]
+#
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import jwt as pyjwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
+from token_auth import KeySet, TokenVerifier, role_required
+
+SECRET = "bench-secret-bench-secret-bench-secret"
+KEY_ID = "bench-key"
+
+
+def make_rsa_key(directory):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption()).decode()
+    jwk = json.loads(pyjwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": KEY_ID, "alg": "RS256", "use": "sig"})
+    jwks_file = os.path.join(directory, "jwks.json")
+    with open(jwks_file, "w") as f:
+        json.dump({"keys": [jwk]}, f)
+    return pem, jwks_file
+
+
+def make_token(algorithm, key):
+    now = datetime.now(timezone.utc)
+    claims = {"sub": {"username": "bench", "role": "dev"}, "jti": str(uuid.uuid4()), "type": "access",
+              "fresh": False, "iat": now, "nbf": now, "exp": now + timedelta(minutes=15)}
+    headers = {"kid": KEY_ID} if algorithm == "RS256" else None
+    return pyjwt.encode(claims, key, algorithm=algorithm, headers=headers)
+
+
+def make_app(algorithm, key_set, blocklist):
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = SECRET
+    app.config["JWT_ALGORITHM"] = algorithm
+    jwt = JWTManager(app)
+
+    def is_revoked(jti):
+        return blocklist.execute("SELECT 1 FROM token_blocklist WHERE jti = ?", (jti,)).fetchone() is not None
+
+    if key_set is not None:
+        jwt.decode_key_loader(lambda header, payload: key_set.get(header.get("kid")))
+    jwt.token_in_blocklist_loader(lambda header, payload: is_revoked(payload["jti"]))
+    app.extensions["token_verifier"] = TokenVerifier(algorithm, SECRET, key_set, is_revoked=is_revoked)
+
+    @app.route("/jwt-required")
+    @jwt_required()
+    def with_jwt_required():
+        current_user = get_jwt_identity()
+        if current_user['role'] != 'dev' and current_user['role'] != 'admin':
+            return jsonify({"error": "Unauthorized"}), 403
+        return jsonify({"ok": True})
+
+    @app.route("/role-required")
+    @role_required('dev', 'admin')
+    def with_role_required():
+        return jsonify({"ok": True})
+
+    return app
+
+
+def bench(client, path, token, requests):
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get(path, headers=headers).status_code == 200
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get(path, headers=headers)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    blocklist = sqlite3.connect(":memory:", check_same_thread=False)
+    blocklist.execute("CREATE TABLE token_blocklist (jti TEXT)")
+    blocklist.execute("CREATE INDEX ix_jti ON token_blocklist (jti)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        pem, jwks_file = make_rsa_key(directory)
+        setups = [
+            ("HS256", None, make_token("HS256", SECRET)),
+            ("RS256", KeySet(jwks_file=jwks_file), make_token("RS256", pem)),
+        ]
+        # Baseline: an endpoint doing nothing but returning JSON
+        empty = Flask(__name__)
+        empty.add_url_rule("/", "empty", lambda: jsonify({"ok": True}))
+        baseline = bench(empty.test_client(), "/", "", args.requests)
+        print(f"{'unauthenticated endpoint':<32}{baseline:>10.1f} us/request")
+
+        for algorithm, key_set, token in setups:
+            client = make_app(algorithm, key_set, blocklist).test_client()
+            for path in ["/jwt-required", "/role-required"]:
+                elapsed = bench(client, path, token, args.requests)
+                print(f"{algorithm + ' ' + path:<32}{elapsed:>10.1f} us/request  (auth overhead {elapsed - baseline:.1f} us)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#
+# Local fakes of every cloud dependency of the backend, for the load tests (loadtest.py).
+#
+# install() must be called before the backend modules are imported. It registers in-memory
+# stand-ins for GCP Secret Manager / Cloud DNS / google.auth, Route53 (boto3) and Azure DNS /
+# Traffic Manager, and replaces the Kubernetes API classes with an in-memory cluster per cloud.
+# Every fake call sleeps for a configurable latency to mimic the round trip to the real service.
+#
+import itertools
+import re
+import sys
+import threading
+import time
+import types
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+# Seconds added to every call of a fake service
+LATENCY = {"k8s": 0.005, "dns": 0.02, "secrets": 0.0}
+
+_ips = itertools.count(1)
+_slept = [0.0]  # total seconds of fake latency, see slept()
+_slept_lock = threading.Lock()
+
+
+def _sleep(service):
+    if LATENCY[service]:
+        time.sleep(LATENCY[service])
+        with _slept_lock:
+            _slept[0] += LATENCY[service]
+
+
+# Total seconds slept by the fakes so far (the part of a latency independent of the machine)
+def slept():
+    with _slept_lock:
+        return _slept[0]
+
+
+class _Anything:
+    # Accepts any attribute access or call, for SDK objects whose results are not used
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return _Anything()
+
+    def __call__(self, *args, **kwargs):
+        _sleep("dns")
+        return _Anything()
+
+
+# ---- Kubernetes
+
+class FakeCluster:
+    def __init__(self, name, nodes=3, pods_per_node=110):
+        self.name = name
+        self.nodes = nodes
+        self.pods_per_node = pods_per_node
+        self.objects = {}  # (kind, namespace, name) -> object
+        self.lock = threading.Lock()
+
+    def create(self, kind, namespace, body):
+        from kubernetes import client
+        from kubernetes.client.rest import ApiException
+        _sleep("k8s")
+        key = (kind, namespace, body.metadata.name)
+        with self.lock:
+            if key in self.objects:
+                raise ApiException(status=409, reason="Conflict")
+            body.metadata.namespace = namespace
+            body.metadata.creation_timestamp = datetime.now(timezone.utc)
+            if kind == "deployment":
+                body.status = client.V1DeploymentStatus(ready_replicas=body.spec.replicas)
+            elif kind == "ingress":
+                ip = next(_ips)
+                body.status = client.V1IngressStatus(load_balancer=client.V1IngressLoadBalancerStatus(
+                    ingress=[client.V1IngressLoadBalancerIngress(ip=f"10.{ip // 65536 % 256}.{ip // 256 % 256}.{ip % 256}")]))
+            self.objects[key] = body
+        return body
+
+    def read(self, kind, namespace, name):
+        from kubernetes.client.rest import ApiException
+        _sleep("k8s")
+        with self.lock:
+            obj = self.objects.get((kind, namespace, name))
+        if obj is None:
+            raise ApiException(status=404, reason="Not Found")
+        return obj
+
+    def delete(self, kind, namespace, name):
+        from kubernetes.client.rest import ApiException
+        _sleep("k8s")
+        with self.lock:
+            if self.objects.pop((kind, namespace, name), None) is None:
+                raise ApiException(status=404, reason="Not Found")
+
+    # Merge patch of the labels and annotations (a None value removes the key)
+    def patch(self, kind, namespace, name, body):
+        obj = self.read(kind, namespace, name)
+        with self.lock:
+            for field in ("labels", "annotations"):
+                values = {**(getattr(obj.metadata, field) or {}), **body.get("metadata", {}).get(field, {})}
+                setattr(obj.metadata, field, {k: v for k, v in values.items() if v is not None})
+        return obj
+
+    # Equality (key=value) and set-based (key in (a,b)) selectors
+    def _matches(self, obj, label_selector):
+        labels = obj.metadata.labels or {}
+        for key, values, equal_key, value in re.findall(r"([\w./-]+) in \(([^)]*)\)|([\w./-]+)=([^,]*)", label_selector or ""):
+            if key and labels.get(key) not in values.split(","):
+                return False
+            if equal_key and labels.get(equal_key) != value:
+                return False
+        return True
+
+    def list(self, kind, namespace=None, label_selector=None):
+        _sleep("k8s")
+        with self.lock:
+            items = [obj for (k, ns, _), obj in self.objects.items()
+                     if k == kind and (namespace is None or ns == namespace) and self._matches(obj, label_selector)]
+        return SimpleNamespace(items=items)
+
+    def delete_collection(self, kind, namespace, label_selector=None):
+        for obj in self.list(kind, namespace, label_selector).items:
+            with self.lock:
+                self.objects.pop((kind, namespace, obj.metadata.name), None)
+
+
+CLUSTERS = {}
+
+
+def _cluster(api_client):
+    return CLUSTERS.setdefault(api_client, FakeCluster(api_client))
+
+
+class FakeAppsV1Api:
+    def __init__(self, api_client=None):
+        self.cluster = _cluster(api_client)
+
+    def create_namespaced_deployment(self, namespace, body):
+        return self.cluster.create("deployment", namespace, body)
+
+    def read_namespaced_deployment(self, name, namespace):
+        return self.cluster.read("deployment", namespace, name)
+
+    def list_namespaced_deployment(self, namespace, label_selector=None):
+        return self.cluster.list("deployment", namespace, label_selector)
+
+    def list_deployment_for_all_namespaces(self, label_selector=None):
+        return self.cluster.list("deployment", None, label_selector)
+
+    def delete_namespaced_deployment(self, name, namespace, body=None):
+        return self.cluster.delete("deployment", namespace, name)
+
+    def patch_namespaced_deployment(self, name, namespace, body):
+        return self.cluster.patch("deployment", namespace, name, body)
+
+    def delete_collection_namespaced_deployment(self, namespace, label_selector=None, **kwargs):
+        return self.cluster.delete_collection("deployment", namespace, label_selector)
+
+
+class FakeCoreV1Api:
+    def __init__(self, api_client=None):
+        self.cluster = _cluster(api_client)
+
+    def create_namespaced_service(self, namespace, body):
+        return self.cluster.create("service", namespace, body)
+
+    def read_namespaced_service(self, name, namespace):
+        return self.cluster.read("service", namespace, name)
+
+    def delete_namespaced_service(self, name, namespace, body=None):
+        return self.cluster.delete("service", namespace, name)
+
+    def delete_collection_namespaced_service(self, namespace, label_selector=None, **kwargs):
+        return self.cluster.delete_collection("service", namespace, label_selector)
+
+    def list_node(self, **kwargs):
+        _sleep("k8s")
+        node = SimpleNamespace(spec=SimpleNamespace(unschedulable=False),
+                               status=SimpleNamespace(allocatable={"pods": str(self.cluster.pods_per_node)}))
+        return SimpleNamespace(items=[node] * self.cluster.nodes)
+
+    def list_pod_for_all_namespaces(self, field_selector=None, **kwargs):
+        return self.cluster.list("deployment")
+
+
+class FakeNetworkingV1Api:
+    def __init__(self, api_client=None):
+        self.cluster = _cluster(api_client)
+
+    def create_namespaced_ingress(self, namespace, body):
+        return self.cluster.create("ingress", namespace, body)
+
+    def read_namespaced_ingress(self, name, namespace):
+        return self.cluster.read("ingress", namespace, name)
+
+    def list_namespaced_ingress(self, namespace, label_selector=None):
+        return self.cluster.list("ingress", namespace, label_selector)
+
+    def replace_namespaced_ingress(self, name, namespace, body):
+        return self.cluster.read("ingress", namespace, name)
+
+    def delete_namespaced_ingress(self, name, namespace, body=None):
+        return self.cluster.delete("ingress", namespace, name)
+
+    def delete_collection_namespaced_ingress(self, namespace, label_selector=None, **kwargs):
+        return self.cluster.delete_collection("ingress", namespace, label_selector)
+
+
+# ---- Cloud SDKs
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+class FakeSecretManagerServiceClient:
+    secrets = {}
+
+    def access_secret_version(self, request):
+        _sleep("secrets")
+        value = self.secrets[request["name"].split("/secrets/")[1].split("/")[0]]
+        return SimpleNamespace(payload=SimpleNamespace(data=value.encode("UTF-8")))
+
+
+class FakeAuthorizedSession:
+    def __init__(self, credentials):
+        pass
+
+    def _respond(self, *args, **kwargs):
+        _sleep("dns")
+        return SimpleNamespace(status_code=200, json=lambda: {}, raise_for_status=lambda: None)
+
+    get = patch = post = delete = _respond
+
+
+def install(database_uri, jwt_secret):
+    FakeSecretManagerServiceClient.secrets = {"database-uri": database_uri, "jwt-secret-key": jwt_secret}
+
+    google = _module("google")
+    cloud = _module("google.cloud")
+    google.cloud = cloud
+    cloud.secretmanager = _module("google.cloud.secretmanager", SecretManagerServiceClient=FakeSecretManagerServiceClient)
+    cloud.dns = _module("google.cloud.dns", Client=_Anything)
+    google.auth = _module("google.auth", default=lambda scopes=None: (None, "loadtest"))
+    _module("google.auth.transport")
+    _module("google.auth.transport.requests", AuthorizedSession=FakeAuthorizedSession)
+
+    _module("boto3", client=lambda service, **kwargs: _Anything())
+
+    _module("azure")
+    _module("azure.identity", DefaultAzureCredential=_Anything)
+    _module("azure.mgmt")
+    _module("azure.mgmt.dns", DnsManagementClient=_Anything)
+    _module("azure.mgmt.trafficmanager", TrafficManagerManagementClient=_Anything)
+
+    # One fake cluster per kube context
+    from kubernetes import client, config
+    config.new_client_from_config = lambda context=None, **kwargs: context
+    client.AppsV1Api = FakeAppsV1Api
+    client.CoreV1Api = FakeCoreV1Api
+    client.NetworkingV1Api = FakeNetworkingV1Api
@@ -0,0 +1,375 @@
+#
+# Load and soak tests of the backend against local fakes of every cloud dependency (fakes.py).
+#
+# The real Flask application (main_app) is served by a threaded WSGI server in this process and
+# driven over HTTP by virtual users. Each virtual user logs in (bcrypt) and then loops over a mix
+# of status / list polls, deploy + undeploy and logins. The number of active users follows a
+# profile:
+#   ramp   from 1 to --users over the run
+#   soak   --users for the whole run (use a long --duration, e.g. 4h, to catch memory growth)
+#   spike  --users / 5, jumping to --users * 2 in the middle fifth of the run
+#
+# Collected: latency histograms per endpoint (p50/p95/p99), error rates, RSS over time and the
+# peak number of checked out DB connections. The results are compared with a stored baseline.
+# Latencies are compared relative to the speed of the machine, measured before the load starts as
+# the median latency of a cheap unauthenticated endpoint (/auth/jwks.json). The fixed fake cloud
+# latency of each operation (also measured before the load) is left out of the ratio, as it does not
+# depend on the machine. A baseline taken on one machine therefore still gates a run on a faster or
+# slower one: a bcrypt or DB regression changes the ratios, a slower runner does not.
+#
+#   python bench/loadtest.py --profile ramp --duration 60 --users 20
+#   python bench/loadtest.py --profile soak --duration 14400 --report soak.json
+#   python bench/loadtest.py --profile spike --update-baseline     # store the current results
+#
+# The exit code is 1 when a threshold of the baseline is exceeded.
+#
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+import fakes
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baselines", "loadtest.json")
+PROFILES = ["ramp", "soak", "spike"]
+
+# Operations of a virtual user and their weights
+SCENARIO = [("status", 40), ("list", 30), ("deploy", 10), ("login", 10), ("status_etag", 10)]
+
+# Endpoint the latencies are expressed relative to: no authentication, no database, no cloud call
+# (404 with HS256 tokens, the JWKS with asymmetric keys). Called REFERENCE_CALLS times without load.
+REFERENCE_PATH = "/auth/jwks.json"
+REFERENCE_CALLS = 200
+
+# Regression thresholds relative to the baseline
+LATENCY_TOLERANCE = 0.25  # p95 may be 25% slower (relative to the reference)...
+LATENCY_SLACK_MS = 5  # ...plus a few milliseconds of noise
+ERROR_RATE_SLACK = 0.01
+RSS_GROWTH_SLACK_MB = 50
+
+
+def active_users(profile, users, elapsed, duration):
+    progress = elapsed / duration
+    if profile == "ramp":
+        return max(1, math.ceil(users * progress))
+    if profile == "spike":
+        return users * 2 if 0.4 <= progress < 0.6 else max(1, users // 5)
+    return users
+
+
+class Histogram:
+    # Latencies in log-spaced buckets of 10% from 0.1 ms
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.errors = 0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds, error):
+        ms = seconds * 1000
+        bucket = max(0, int(math.log(max(ms, 0.1) / 0.1, 1.1)))
+        with self.lock:
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+            self.count += 1
+            self.errors += error
+            self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        target = self.count * p / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return round(min(0.1 * 1.1 ** (bucket + 1), self.max), 2)
+        return 0.0
+
+    def summary(self, duration):
+        return {
+            "count": self.count,
+            "rps": round(self.count / duration, 1),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max, 2),
+            "error_rate": round(self.errors / self.count, 4) if self.count else 0.0,
+        }
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.histograms = {name: Histogram() for name, _ in SCENARIO + [("undeploy", 0)]}
+        self.rss = []  # (elapsed, MB)
+        self.max_checked_out = 0
+        self.stop = threading.Event()
+
+    # ---- application under test
+
+    def start_app(self, work_dir):
+        database_uri = self.args.database_uri or f"sqlite:///{os.path.join(work_dir, 'loadtest.db')}"
+        fakes.LATENCY.update({"k8s": self.args.k8s_latency, "dns": self.args.dns_latency})
+        fakes.install(database_uri, jwt_secret=uuid.uuid4().hex * 2)
+
+        from config import Config
+        Config.SQLALCHEMY_ENGINE_OPTIONS = {"pool_size": self.args.pool_size, "max_overflow": 0, "pool_timeout": 10} \
+            if not database_uri.startswith("sqlite") else {"connect_args": {"timeout": 30}}
+        Config.AUDIT_SINK = "jsonl"
+        Config.AUDIT_DIR = os.path.join(work_dir, "audit")
+        import main_app
+        from models import db
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        self.app = main_app.app
+        with self.app.app_context():
+            db.create_all()
+            self.pool = db.engine.pool
+        WSGIRequestHandler.log_request = lambda *args, **kwargs: None
+        self.server = make_server("127.0.0.1", 0, self.app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.port = self.server.server_port
+
+    def request(self, method, path, body=None, token=None, headers=None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        headers = dict(headers or {})
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        try:
+            connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = connection.getresponse()
+            data = response.read()
+            return response.status, response.getheader("ETag"), json.loads(data) if data else None
+        finally:
+            connection.close()
+
+    def timed(self, name, method, path, body=None, token=None, headers=None):
+        start = time.perf_counter()
+        try:
+            status, etag, data = self.request(method, path, body, token, headers)
+            error = status >= 400
+        except Exception:
+            status, etag, data, error = None, None, None, True
+        self.histograms[name].record(time.perf_counter() - start, error)
+        return status, etag, data
+
+    # ---- virtual users
+
+    def register_accounts(self):
+        for i in range(self.args.accounts):
+            self.request("POST", "/auth/register", {"username": f"user{i}", "password": "loadtest", "role": "dev"})
+
+    def virtual_user(self, index):
+        random.seed(index)
+        username = f"user{index % self.args.accounts}"
+        namespace = f"tenant-{index % self.args.tenants}"
+        token, etag = None, None
+        operations = [name for name, weight in SCENARIO for _ in range(weight)]
+
+        while not self.stop.is_set():
+            if index >= self.target_users:
+                time.sleep(0.1)
+                continue
+            operation = "login" if token is None else random.choice(operations)
+            for name, method, path, body, headers in self.operation_requests(operation, username, namespace, etag):
+                status, new_etag, data = self.timed(name, method, path, body, token=token, headers=headers)
+                if name == "login" and status == 200 and data:
+                    token = data.get("access_token")
+                etag = new_etag or etag
+            time.sleep(self.args.think_time)
+
+    # Requests (histogram name, method, path, body, headers) of an operation of a virtual user
+    def operation_requests(self, operation, username, namespace, etag=None):
+        if operation == "login":
+            return [("login", "POST", "/auth/login", {"username": username, "password": "loadtest"}, None)]
+        if operation in ("status", "status_etag"):
+            headers = {"If-None-Match": etag} if operation == "status_etag" and etag else None
+            return [(operation, "GET", f"/deployment/status?namespace={namespace}&cloud_provider=gcp&appname=shared", None, headers)]
+        if operation == "list":
+            return [("list", "GET", f"/deployment/deployments?namespace={namespace}&cloud_provider=gcp", None, None)]
+        params = {"namespace": namespace, "appname": f"app-{uuid.uuid4().hex[:10]}", "domain": "loadtest.example.com", "cloud_provider": "gcp"}
+        return [("deploy", "POST", "/deployment/deploy", params, None), ("undeploy", "POST", "/deployment/undeploy", params, None)]
+
+    def sample(self, start):
+        while not self.stop.wait(1):
+            self.rss.append((round(time.monotonic() - start, 1), round(rss_mb(), 1)))
+            if hasattr(self.pool, "checkedout"):
+                self.max_checked_out = max(self.max_checked_out, self.pool.checkedout())
+
+    # Measure, on the idle server, the median latency (ms) of the reference endpoint and the median
+    # fake cloud latency (ms) of the requests of every operation
+    def calibrate(self, token):
+        latencies = []
+        for _ in range(REFERENCE_CALLS):
+            start = time.perf_counter()
+            self.request("GET", REFERENCE_PATH)
+            latencies.append((time.perf_counter() - start) * 1000)
+        self.reference_ms = round(sorted(latencies)[len(latencies) // 2], 3)
+
+        waits = {}
+        for operation, _ in SCENARIO:
+            for _ in range(5):
+                for name, method, path, body, headers in self.operation_requests(operation, "user0", "tenant-0"):
+                    slept = fakes.slept()
+                    self.request(method, path, body, token, headers)
+                    waits.setdefault(name, []).append((fakes.slept() - slept) * 1000)
+        self.fake_wait_ms = {name: round(sorted(w)[len(w) // 2], 2) for name, w in waits.items()}
+
+    # ---- run
+
+    def run(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            self.start_app(work_dir)
+            self.register_accounts()
+
+            # The shared app polled by every tenant
+            token = self.request("POST", "/auth/login", {"username": "user0", "password": "loadtest"})[2]["access_token"]
+            for tenant in range(self.args.tenants):
+                self.request("POST", "/deployment/deploy", {"namespace": f"tenant-{tenant}", "appname": "shared",
+                                                            "domain": "loadtest.example.com", "cloud_provider": "gcp"}, token=token)
+            self.calibrate(token)
+
+            max_users = self.args.users * 2 if self.args.profile == "spike" else self.args.users
+            self.target_users = 0
+            threads = [threading.Thread(target=self.virtual_user, args=(i,), daemon=True) for i in range(max_users)]
+            start = time.monotonic()
+            threading.Thread(target=self.sample, args=(start,), daemon=True).start()
+            for thread in threads:
+                thread.start()
+            while (elapsed := time.monotonic() - start) < self.args.duration:
+                self.target_users = active_users(self.args.profile, self.args.users, elapsed, self.args.duration)
+                time.sleep(0.2)
+            self.stop.set()
+            for thread in threads:
+                thread.join(timeout=60)
+            self.server.shutdown()
+            from audit import audit_log
+            audit_log.flush()
+
+        return self.results(time.monotonic() - start)
+
+    def results(self, duration):
+        warm = [mb for t, mb in self.rss if t >= duration * 0.1] or [mb for _, mb in self.rss] or [rss_mb()]
+        endpoints = {name: h.summary(duration) for name, h in self.histograms.items() if h.count}
+        for name, summary in endpoints.items():
+            summary["fake_wait_ms"] = self.fake_wait_ms.get(name, 0)
+            summary["p95_relative"] = round(max(summary["p95_ms"] - summary["fake_wait_ms"], 0) / self.reference_ms, 2)
+        return {
+            "profile": self.args.profile,
+            "duration_s": round(duration, 1),
+            "users": self.args.users,
+            "reference_ms": self.reference_ms,
+            "endpoints": endpoints,
+            "rss_mb": {"start": warm[0], "end": warm[-1], "peak": max(warm), "growth": round(warm[-1] - warm[0], 1)},
+            "rss_samples": self.rss,
+            "db_pool_max_checked_out": self.max_checked_out,
+        }
+
+
+# Compare results with the baseline of their profile. Returns the list of regressions.
+# p95 latencies (without their fake cloud latency) are compared as multiples of the reference latency of each run.
+def compare(results, baseline):
+    failures = []
+    reference_ms = results["reference_ms"]
+    for name, expected in baseline.get("endpoints", {}).items():
+        actual = results["endpoints"].get(name)
+        if actual is None:
+            continue
+        limit = expected["p95_relative"] * (1 + LATENCY_TOLERANCE) + LATENCY_SLACK_MS / reference_ms
+        if actual["p95_relative"] > limit:
+            failures.append(f"{name}: p95 {actual['p95_relative']}x the reference > {limit:.1f}x "
+                            f"({actual['p95_ms']} ms > {limit * reference_ms + actual['fake_wait_ms']:.1f} ms)")
+        if actual["error_rate"] > expected["error_rate"] + ERROR_RATE_SLACK:
+            failures.append(f"{name}: error rate {actual['error_rate']} > {expected['error_rate'] + ERROR_RATE_SLACK:.4f}")
+    growth_limit = baseline.get("rss_mb", {}).get("growth", 0) + RSS_GROWTH_SLACK_MB
+    if results["rss_mb"]["growth"] > growth_limit:
+        failures.append(f"RSS growth {results['rss_mb']['growth']} MB > {growth_limit} MB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and soak tests of the backend")
+    parser.add_argument("--profile", choices=PROFILES, default="ramp")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--accounts", type=int, default=5, help="registered accounts shared by the users")
+    parser.add_argument("--tenants", type=int, default=5, help="namespaces the users deploy to")
+    parser.add_argument("--think-time", type=float, default=0.05, help="seconds between two requests of a user")
+    parser.add_argument("--k8s-latency", type=float, default=fakes.LATENCY["k8s"], help="seconds per fake Kubernetes call")
+    parser.add_argument("--dns-latency", type=float, default=fakes.LATENCY["dns"], help="seconds per fake DNS call")
+    parser.add_argument("--database-uri", help="e.g. a local Postgres stand-in (default: SQLite in a temporary directory)")
+    parser.add_argument("--pool-size", type=int, default=5, help="DB connection pool size (not SQLite)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the baseline of the profile")
+    parser.add_argument("--report", help="write the full results as JSON")
+    args = parser.parse_args()
+
+    results = LoadTest(args).run()
+
+    print(f"{'endpoint':<14}{'count':>8}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'errors':>9}")
+    for name, s in results["endpoints"].items():
+        print(f"{name:<14}{s['count']:>8}{s['rps']:>8}{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}{s['max_ms']:>9}{s['error_rate']:>9.2%}")
+    rss = results["rss_mb"]
+    print(f"RSS {rss['start']} -> {rss['end']} MB (peak {rss['peak']}, growth {rss['growth']}), "
+          f"DB pool peak checked out: {results['db_pool_max_checked_out']}, reference latency: {results['reference_ms']} ms")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.update_baseline:
+        baselines[args.profile] = {"endpoints": {name: {"p95_relative": s["p95_relative"], "error_rate": s["error_rate"]}
+                                                 for name, s in results["endpoints"].items()},
+                                   "rss_mb": {"growth": rss["growth"]},
+                                   "users": args.users, "duration_s": args.duration}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Baseline of {args.profile} updated in {args.baseline}")
+        return 0
+
+    if args.profile not in baselines:
+        print(f"No baseline for {args.profile} in {args.baseline}, nothing to compare")
+        return 0
+    baseline = baselines[args.profile]
+    if (baseline.get("users"), baseline.get("duration_s")) != (args.users, args.duration):
+        print(f"Warning: the baseline of {args.profile} was taken with --users {baseline.get('users')} "
+              f"--duration {baseline.get('duration_s')}, the ratios are only comparable with the same load")
+    failures = compare(results, baseline)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    print("FAIL" if failures else "PASS")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+#
+# Audit trail of who deployed or undeployed what and when.
+#
+# Recording an event only appends it to an in-memory buffer. A background thread flushes the
+# buffer every AUDIT_FLUSH_INTERVAL seconds (or as soon as AUDIT_BATCH_SIZE events are pending)
+# to one of the sinks:
+#   - database: one multi-row INSERT per batch into the audit_event table (indexed by user, app and time)
+#   - jsonl:    append-only JSONL segment files in AUDIT_DIR, rotated every AUDIT_SEGMENT_BYTES,
+#               with an in-memory index by user and app per segment. Several processes (gunicorn
+#               workers) may share AUDIT_DIR: batches are appended with a single O_APPEND write
+#               under an exclusive lock of the directory, so lines never interleave.
+#
+import atexit
+import fcntl
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from models import db, AuditEvent
+
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 100))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 2))
+AUDIT_MAX_BUFFER = int(os.getenv('AUDIT_MAX_BUFFER', 100000))  # oldest events are dropped beyond
+AUDIT_SEGMENT_BYTES = int(os.getenv('AUDIT_SEGMENT_BYTES', 64 * 1024 * 1024))
+
+FIELDS = ["created_at", "username", "action", "app_name", "namespace", "cloud_provider", "status", "details"]
+
+
+def _utc(t):
+    if t is None:
+        return None
+    return t.replace(tzinfo=timezone.utc) if t.tzinfo is None else t.astimezone(timezone.utc)
+
+
+class DatabaseSink:
+    def __init__(self, app):
+        self.app = app
+
+    def write(self, events):
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(AuditEvent), events)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def query(self, username=None, app_name=None, since=None, until=None, limit=100):
+        query = AuditEvent.query
+        if username:
+            query = query.filter(AuditEvent.username == username)
+        if app_name:
+            query = query.filter(AuditEvent.app_name == app_name)
+        if since:
+            query = query.filter(AuditEvent.created_at >= since)
+        if until:
+            query = query.filter(AuditEvent.created_at < until)
+        events = query.order_by(AuditEvent.created_at.desc()).limit(limit).all()
+        return [{field: getattr(e, field) for field in FIELDS} for e in events]
+
+
+class _SegmentIndex:
+    # Offsets of the lines of a segment by user and app, extended as the segment grows
+    def __init__(self, path):
+        self.path = path
+        self.indexed_bytes = 0
+        self.offsets = []  # (offset, created_at) of every line
+        self.by_username = {}
+        self.by_app_name = {}
+
+    def update(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self.indexed_bytes)
+            offset = self.indexed_bytes
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written line
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    offset += len(line)  # corrupted line, skipped
+                    continue
+                self.offsets.append((offset, event["created_at"]))
+                self.by_username.setdefault(event.get("username"), []).append(offset)
+                self.by_app_name.setdefault(event.get("app_name"), []).append(offset)
+                offset += len(line)
+            self.indexed_bytes = offset
+
+
+class JsonlSink:
+    def __init__(self, directory, segment_bytes=AUDIT_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._indexes = {}  # segment path -> _SegmentIndex
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, ".lock")
+
+    # Segments are named after the time of their first event, so they sort chronologically
+    def segments(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("audit-") and n.endswith(".jsonl"))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def _current_segment(self, first_event):
+        segments = self.segments()
+        if segments and os.path.getsize(segments[-1]) < self.segment_bytes:
+            return segments[-1]
+        stamp = first_event["created_at"].replace(":", "").replace("-", "").replace("+", "_")
+        return os.path.join(self.directory, f"audit-{stamp}.jsonl")
+
+    # The lock of the directory is held across processes while the segment is chosen and appended to
+    def write(self, events):
+        events = [{**e, "created_at": e["created_at"].isoformat()} for e in events]
+        lines = "".join(json.dumps(e, default=str) + "\n" for e in events).encode()
+        with self._lock, open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            fd = os.open(self._current_segment(events[0]), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                written = 0
+                while written < len(lines):
+                    written += os.write(fd, lines[written:])
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def query(self, username=None, app_name=None, since=None, until=None, limit=100):
+        since = since.isoformat() if since else None
+        until = until.isoformat() if until else None
+        results = []
+        next_start = None  # time of the first event of the next (newer) segment
+        for path in reversed(self.segments()):
+            # A segment ends where the next one starts: older segments are out of range
+            if since and next_start and next_start < since:
+                break
+            with self._lock:
+                index = self._indexes.setdefault(path, _SegmentIndex(path))
+                index.update()
+            if not index.offsets:
+                continue
+            next_start = index.offsets[0][1]
+
+            candidates = None
+            if username:
+                candidates = set(index.by_username.get(username, []))
+            if app_name:
+                offsets = set(index.by_app_name.get(app_name, []))
+                candidates = offsets if candidates is None else candidates & offsets
+            selected = [o for o, t in index.offsets
+                        if (candidates is None or o in candidates)
+                        and (not since or t >= since) and (not until or t < until)]
+
+            with open(path, 'rb') as f:
+                for offset in reversed(selected):
+                    f.seek(offset)
+                    results.append(json.loads(f.readline()))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+
+class AuditLog:
+    def __init__(self):
+        self.sink = None
+        self._buffer = deque(maxlen=AUDIT_MAX_BUFFER)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    # Select the sink from AUDIT_SINK (database or jsonl) and start the flushing thread
+    def init_app(self, app):
+        if app.config.get('AUDIT_SINK', 'database') == 'jsonl':
+            self.sink = JsonlSink(app.config.get('AUDIT_DIR', 'audit'))
+        else:
+            self.sink = DatabaseSink(app)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="audit-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    # Record an event. Does not block on any I/O.
+    def record(self, action, username=None, app_name=None, namespace=None, cloud_provider=None, status=None, **details):
+        details = {key: value for key, value in details.items() if value is not None}
+        self._buffer.append({
+            "created_at": datetime.now(timezone.utc),
+            "username": username,
+            "action": action,
+            "app_name": app_name,
+            "namespace": namespace,
+            "cloud_provider": cloud_provider,
+            "status": status,
+            "details": details or None,
+        })
+        if len(self._buffer) >= AUDIT_BATCH_SIZE:
+            self._wakeup.set()
+
+    # Write the buffered events to the sink, in batches of AUDIT_BATCH_SIZE
+    def flush(self):
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < AUDIT_BATCH_SIZE:
+                    batch.append(self._buffer.popleft())
+                try:
+                    self.sink.write(batch)
+                except Exception as e:
+                    print(f"Failed to write audit events: {e}")
+                    self._buffer.extendleft(reversed(batch))  # retried at the next flush
+                    return
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(AUDIT_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to flush audit events: {e}")  # the thread keeps running
+
+    # Query the events by user, app and time (newest first). Pending events are flushed first.
+    # since and until are normalized to UTC (naive times are taken as UTC), the time zone of the events.
+    def query(self, since=None, until=None, **filters):
+        since, until = [_utc(t) for t in (since, until)]
+        self.flush()
+        return self.sink.query(since=since, until=until, **filters)
+
+
+audit_log = AuditLog()
@@ -1,5 +1,7 @@
-from flask import Blueprint, request, jsonify
+import os
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import (
+    JWTManager,
     create_access_token,
     jwt_required,
     get_jwt_identity,
@@ -8,17 +10,72 @@ from flask_jwt_extended import (
     jwt_required,
 )
 from models import db, User, TokenBlocklist
+from token_auth import ASYMMETRIC_ALGORITHMS, KeySet, TokenVerifier, get_verifier, public_jwk, jwk_thumbprint
 import bcrypt
 from datetime import datetime, timedelta, timezone
 
 auth_bp = Blueprint('auth', __name__)
+jwt = JWTManager()
+
+# Set up token signing and verification for the application.
+# HS256 uses JWT_SECRET_KEY. RS256/ES256 sign with the private key JWT_PRIVATE_KEY_FILE (advertised with
+# its kid, see load_private_key) and verify with the public keys of JWT_JWKS_FILE or JWT_JWKS_URL.
+def init_token_auth(app):
+    jwt.init_app(app)
+    algorithm = app.config.get('JWT_ALGORITHM', 'HS256')
+    key_set = None
+    if algorithm in ASYMMETRIC_ALGORITHMS:
+        key_set = KeySet(app.config.get('JWT_JWKS_FILE'), app.config.get('JWT_JWKS_URL'))
+    app.extensions['token_verifier'] = TokenVerifier(
+        algorithm, app.config.get('JWT_SECRET_KEY'), key_set, is_revoked=is_token_revoked
+    )
+
+_private_key = {}  # path -> ((mtime of the key file, mtime of the kid file), PEM, kid)
+
+# Current private signing key and its kid, reloaded together when the key file (or the kid file
+# next to it) changes, so that replacing the key file rotates both. The kid is the content of
+# <key file>.kid when it exists, the RFC 7638 thumbprint of the public key otherwise.
+def load_private_key(path):
+    kid_path = f"{path}.kid"
+    version = (os.path.getmtime(path), os.path.getmtime(kid_path) if os.path.exists(kid_path) else None)
+    cached = _private_key.get(path)
+    if cached is None or cached[0] != version:
+        with open(path) as f:
+            pem = f.read()
+        if version[1] is not None:
+            with open(kid_path) as f:
+                kid = f.read().strip()
+        else:
+            kid = jwk_thumbprint(public_jwk(pem))
+        cached = _private_key[path] = (version, pem, kid)
+    return cached[1], cached[2]
+
+@jwt.encode_key_loader
+def signing_key(identity):
+    if current_app.config.get('JWT_ALGORITHM', 'HS256') in ASYMMETRIC_ALGORITHMS:
+        return load_private_key(current_app.config['JWT_PRIVATE_KEY_FILE'])[0]
+    return current_app.config['JWT_SECRET_KEY']
+
+@jwt.decode_key_loader
+def verification_key(jwt_header, jwt_payload):
+    verifier = get_verifier()
+    if verifier.key_set is not None:
+        return verifier.key_set.get(jwt_header.get('kid'))
+    return current_app.config['JWT_SECRET_KEY']
+
+# Advertise the signing key so that verifiers pick the right public key of the key set
+@jwt.additional_headers_loader
+def key_id_header(identity):
+    if current_app.config.get('JWT_ALGORITHM', 'HS256') in ASYMMETRIC_ALGORITHMS:
+        return {"kid": load_private_key(current_app.config['JWT_PRIVATE_KEY_FILE'])[1]}
+    return {}
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.json
     username, password, role = data['username'], data['password'], data['role']
     
-    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     
     new_user = User(username=username, password_hash=password_hash, role=role)
     db.session.add(new_user)
@@ -52,11 +109,22 @@ def add_token_to_blocklist(jti):
 def logout():
     jti = get_jwt()["jti"]  # Get the unique identifier (JTI) of the token
     add_token_to_blocklist(jti)
+    get_verifier().revoke(jti, get_jwt()["exp"])  # drop it from the claims cache of this process
     return jsonify({"status": "Logged out successfully"})
 
+# Public keys verifying the tokens, for other services (asymmetric signing only)
+@auth_bp.route('/jwks.json', methods=['GET'])
+def jwks():
+    verifier = get_verifier()
+    if verifier.key_set is None:
+        return jsonify({"error": "Tokens are not signed with an asymmetric key"}), 404
+    return jsonify(verifier.key_set.to_jwks())
+
+def is_token_revoked(jti):
+    token = TokenBlocklist.query.filter_by(jti=jti).first()
+    return token is not None
+
 # Token blacklist check (callback for Flask-JWT-Extended)
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
-    jti = jwt_payload["jti"]
-    token = TokenBlocklist.query.filter_by(jti=jti).first()
-    return token is not None
\ No newline at end of file
+    return is_token_revoked(jwt_payload["jti"])
\ No newline at end of file
@@ -0,0 +1,99 @@
+#
+# Response cache for the read endpoints, keyed by tenant (namespace) and query.
+#
+# Entries are invalidated by deployment events (deploy/undeploy) of their tenant: each tenant
+# has a generation counter that is bumped on every event, entries of an older generation are
+# stale. A response is stored with the generation read before the view ran: a response rendered
+# while an event was published is not stored. The TTL is only a backstop (e.g. for changes made
+# by another gunicorn worker).
+# Cached responses carry a strong ETag so that polling clients get a 304 without any body.
+#
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response, Response
+
+CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 30))  # seconds
+CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+
+
+class ResponseCache:
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires, generation, body, etag)
+        self._generations = {}  # tenant -> generation
+        self._lock = threading.Lock()
+
+    # Return (body, etag) of a fresh entry, or None
+    def get(self, tenant, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, generation, body, etag = entry
+            if expires < time.monotonic() or generation != self._generations.get(tenant, 0):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return body, etag
+
+    # Current generation of a tenant, to be read before rendering a response to store
+    def generation(self, tenant):
+        with self._lock:
+            return self._generations.get(tenant, 0)
+
+    # Store a response body rendered at the given generation of its tenant and return its strong ETag.
+    # The body is not stored if the tenant was invalidated since (it may predate the change).
+    def set(self, tenant, key, body, generation):
+        etag = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            if generation != self._generations.get(tenant, 0):
+                return etag
+            self._entries[key] = (time.monotonic() + self.ttl, generation, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+    # Drop every cached response of a tenant (called on deployment events)
+    def invalidate(self, tenant):
+        with self._lock:
+            self._generations[tenant] = self._generations.get(tenant, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+response_cache = ResponseCache()
+
+
+# Decorator caching the JSON response of a GET endpoint per tenant and query string.
+# Handles If-None-Match: a client sending the current ETag gets an empty 304.
+# Only successful responses are cached.
+def cached_response(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        tenant = request.args.get('namespace', 'default')
+        key = (tenant, request.path, tuple(sorted(request.args.items(multi=True))))
+
+        cached = response_cache.get(tenant, key)
+        if cached is None:
+            generation = response_cache.generation(tenant)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            cached = body, response_cache.set(tenant, key, body, generation)
+
+        body, etag = cached
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    return wrapper
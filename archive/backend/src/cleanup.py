@@ -0,0 +1,200 @@
+#
+# Garbage collection of stale tenant apps.
+#
+# Apps created by the platform carry the managed-by label and a last-activity annotation
+# (see deploy_steps.py), set when the app is deployed and refreshed when it is accessed through
+# the API (touch_app, e.g. status polls). That is not the traffic of the app itself, so only the
+# apps opted in at deploy time are collected: the ones with the gc label, set for the default-app
+# deployments or when the deploy request asks for it ("gc": true). Any other app is never deleted.
+#
+# A collectable app without activity for ttl_hours is marked idle; an app still idle grace_hours
+# later is deleted together with its DNS records (including the global hostnames published by
+# /global-dns). An app active again before is unmarked. Deletes are done in bulk per namespace with
+# label-selector collection deletes instead of one call per object.
+#
+# Run from the admin API (/deployment/admin/gc) or as a scheduled job:
+#
+#   python cleanup.py --clouds aws gcp azure [--namespace tenant-a] [--ttl-hours 168] [--dry-run]
+#
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from kubernetes import client
+from deploy_steps import (MANAGED_BY_LABEL, MANAGED_BY, LAST_ACTIVITY_ANNOTATION, GC_LABEL,
+                          global_dns_hosts, delete_global_dns_endpoints)
+from dns_manager import delete_dns_records
+from events import broker, UNDEPLOYED
+from utils import SUPPORTED_CLOUDS, get_api_client
+
+IDLE_TTL_HOURS = float(os.getenv('GC_IDLE_TTL_HOURS', 7 * 24))
+GRACE_HOURS = float(os.getenv('GC_GRACE_HOURS', 24))
+# Seconds between two refreshes of the last-activity annotation of an app by the same process
+ACTIVITY_REFRESH_INTERVAL = float(os.getenv('GC_ACTIVITY_REFRESH_INTERVAL', 3600))
+# Apps deleted per collection delete (keeps the label selector short)
+DELETE_BATCH_SIZE = 50
+
+PLATFORM_SELECTOR = f"{MANAGED_BY_LABEL}={MANAGED_BY}"
+COLLECTABLE_SELECTOR = f"{PLATFORM_SELECTOR},{GC_LABEL}=true"
+IDLE_LABEL = "multi-cloud-platform/idle"
+IDLE_SINCE_ANNOTATION = "multi-cloud-platform/idle-since"
+
+
+_touched = {}  # (cloud provider, namespace, app name) -> time of the last refresh of its activity
+_touched_lock = threading.Lock()
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+# Record an access to an app as activity. Its last-activity annotation is refreshed in a background
+# thread, at most every ACTIVITY_REFRESH_INTERVAL seconds, so that polling apps costs no extra API call.
+def touch_app(cloud_provider, namespace, app_name):
+    key = (cloud_provider, namespace, app_name)
+    now = time.monotonic()
+    with _touched_lock:
+        last = _touched.get(key)
+        if last is not None and now - last < ACTIVITY_REFRESH_INTERVAL:
+            return
+        _touched[key] = now
+    threading.Thread(target=_refresh_activity, args=key, daemon=True).start()
+
+
+def _refresh_activity(cloud_provider, namespace, app_name):
+    try:
+        apps_v1 = client.AppsV1Api(api_client=get_api_client(cloud_provider))
+        deployment = apps_v1.read_namespaced_deployment(app_name, namespace)
+        if (deployment.metadata.labels or {}).get(GC_LABEL) != "true":
+            return  # never collected
+        apps_v1.patch_namespaced_deployment(app_name, namespace, {"metadata": {"annotations": {
+            LAST_ACTIVITY_ANNOTATION: datetime.now(timezone.utc).isoformat(),
+        }}})
+    except Exception as e:
+        print(f"Failed to record the activity of {namespace}/{app_name} on {cloud_provider}: {e}")
+        with _touched_lock:
+            _touched.pop((cloud_provider, namespace, app_name), None)  # retried on the next access
+
+
+# List the apps created by the platform on a cloud, in a namespace or in all of them
+def list_platform_apps(cloud_provider, namespace=None):
+    apps_v1 = client.AppsV1Api(api_client=get_api_client(cloud_provider))
+    if namespace:
+        deployments = apps_v1.list_namespaced_deployment(namespace, label_selector=PLATFORM_SELECTOR).items
+    else:
+        deployments = apps_v1.list_deployment_for_all_namespaces(label_selector=PLATFORM_SELECTOR).items
+
+    apps = []
+    for deployment in deployments:
+        annotations = deployment.metadata.annotations or {}
+        apps.append({
+            "cloud_provider": cloud_provider,
+            "namespace": deployment.metadata.namespace,
+            "app_name": deployment.metadata.name,
+            "collectable": (deployment.metadata.labels or {}).get(GC_LABEL) == "true",
+            "last_activity": _parse_time(annotations.get(LAST_ACTIVITY_ANNOTATION)) or deployment.metadata.creation_timestamp,
+            "idle_since": _parse_time(annotations.get(IDLE_SINCE_ANNOTATION)),
+        })
+    return apps
+
+
+# Mark (idle_since = now) or unmark (idle_since = None) an app as idle
+def _set_idle(cloud_provider, namespace, app_name, idle_since):
+    apps_v1 = client.AppsV1Api(api_client=get_api_client(cloud_provider))
+    apps_v1.patch_namespaced_deployment(app_name, namespace, {"metadata": {
+        "labels": {IDLE_LABEL: "true" if idle_since else None},
+        "annotations": {IDLE_SINCE_ANNOTATION: idle_since.isoformat() if idle_since else None},
+    }})
+
+
+# Delete the deployments, services, ingresses and DNS records of several apps of a namespace
+def delete_apps(cloud_provider, namespace, app_names):
+    api_client = get_api_client(cloud_provider)
+    apps_v1 = client.AppsV1Api(api_client=api_client)
+    core_v1 = client.CoreV1Api(api_client=api_client)
+    networking_v1 = client.NetworkingV1Api(api_client=api_client)
+
+    for i in range(0, len(app_names), DELETE_BATCH_SIZE):
+        batch = app_names[i:i + DELETE_BATCH_SIZE]
+        selector = f"{COLLECTABLE_SELECTOR},app in ({','.join(batch)})"
+
+        # DNS records first, while the ingress IPs are still known. The global hostnames (routed
+        # records of /global-dns, possibly hosted by another cloud) only lose the endpoint of this cloud.
+        records = []
+        for ingress in networking_v1.list_namespaced_ingress(namespace, label_selector=selector).items:
+            lb_ingress = ingress.status.load_balancer.ingress if ingress.status.load_balancer else None
+            if not lb_ingress or not lb_ingress[0].ip:
+                continue
+            global_hosts = global_dns_hosts(ingress)
+            delete_global_dns_endpoints(cloud_provider, lb_ingress[0].ip, global_hosts)
+            records += [(rule.host, lb_ingress[0].ip) for rule in ingress.spec.rules or []
+                        if rule.host and rule.host not in global_hosts]
+        delete_dns_records(cloud_provider, records)
+
+        apps_v1.delete_collection_namespaced_deployment(namespace, label_selector=selector, propagation_policy="Background")
+        core_v1.delete_collection_namespaced_service(namespace, label_selector=selector)
+        networking_v1.delete_collection_namespaced_ingress(namespace, label_selector=selector)
+
+        for app_name in batch:
+            broker.publish([f"namespace:{namespace}"], UNDEPLOYED, deployment_id=None, cloud_provider=cloud_provider,
+                           namespace=namespace, app_name=app_name, reason="idle")
+
+
+# Mark the idle collectable apps of a cloud and delete the ones idle for longer than the grace period.
+# Returns what was (or, with dry_run, would be) marked, unmarked and deleted.
+def collect(cloud_provider, namespace=None, ttl_hours=IDLE_TTL_HOURS, grace_hours=GRACE_HOURS, dry_run=False):
+    now = datetime.now(timezone.utc)
+    report = {"cloud_provider": cloud_provider, "marked": [], "unmarked": [], "deleted": [], "active": 0}
+    to_delete = {}  # namespace -> app names
+
+    for app in list_platform_apps(cloud_provider, namespace):
+        if not app["collectable"]:
+            continue
+        name = f"{app['namespace']}/{app['app_name']}"
+        idle = now - app["last_activity"] >= timedelta(hours=ttl_hours)
+        if not idle:
+            if app["idle_since"]:
+                report["unmarked"].append(name)
+                if not dry_run:
+                    _set_idle(cloud_provider, app["namespace"], app["app_name"], None)
+            else:
+                report["active"] += 1
+        elif not app["idle_since"]:
+            report["marked"].append(name)
+            if not dry_run:
+                _set_idle(cloud_provider, app["namespace"], app["app_name"], now)
+        elif now - app["idle_since"] >= timedelta(hours=grace_hours):
+            report["deleted"].append(name)
+            to_delete.setdefault(app["namespace"], []).append(app["app_name"])
+
+    if not dry_run:
+        for app_namespace, app_names in to_delete.items():
+            delete_apps(cloud_provider, app_namespace, app_names)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete the tenant apps idle for too long")
+    parser.add_argument("--clouds", nargs="+", choices=SUPPORTED_CLOUDS, default=SUPPORTED_CLOUDS)
+    parser.add_argument("--namespace", help="only this namespace (default: all namespaces)")
+    parser.add_argument("--ttl-hours", type=float, default=IDLE_TTL_HOURS, help="inactivity after which an app is marked idle")
+    parser.add_argument("--grace-hours", type=float, default=GRACE_HOURS, help="time an app stays marked before deletion")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    failed = False
+    for cloud_provider in args.clouds:
+        try:
+            report = collect(cloud_provider, args.namespace, args.ttl_hours, args.grace_hours, args.dry_run)
+        except Exception as e:
+            print(f"[{cloud_provider}] failed: {e}")
+            failed = True
+            continue
+        print(f"[{cloud_provider}] active: {report['active']}, marked: {report['marked']}, "
+              f"unmarked: {report['unmarked']}, deleted: {report['deleted']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,17 +1,29 @@
 import os
 from google.cloud import secretmanager
 
-class Config:
-    SECRET_MANAGER_CLIENT = secretmanager.SecretManagerServiceClient()
+SECRET_MANAGER_CLIENT = secretmanager.SecretManagerServiceClient()
+
+def get_secret(secret_name):
+    try:
+        response = SECRET_MANAGER_CLIENT.access_secret_version(request={"name": secret_name})
+        return response.payload.data.decode("UTF-8")
+    except Exception as e:
+        print(f"Failed to retrieve secret: {e}")
+        raise
 
-    @staticmethod
-    def get_secret(secret_name):
-        try:
-            response = Config.SECRET_MANAGER_CLIENT.access_secret_version(request={"name": secret_name})
-            return response.payload.data.decode("UTF-8")
-        except Exception as e:
-            print(f"Failed to retrieve secret: {e}")
-            raise
+class Config:
+    SECRET_MANAGER_CLIENT = SECRET_MANAGER_CLIENT
+    get_secret = staticmethod(get_secret)
 
     SQLALCHEMY_DATABASE_URI = get_secret("projects/multi-cloud-platform/secrets/database-uri/versions/latest")
     JWT_SECRET_KEY = get_secret("projects/multi-cloud-platform/secrets/jwt-secret-key/versions/latest")
+
+    # Token signing: HS256 with JWT_SECRET_KEY, or RS256/ES256 with a private key and a JWKS of the public keys
+    JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
+    JWT_PRIVATE_KEY_FILE = os.getenv('JWT_PRIVATE_KEY_FILE')
+    JWT_JWKS_FILE = os.getenv('JWT_JWKS_FILE')
+    JWT_JWKS_URL = os.getenv('JWT_JWKS_URL')
+
+    # Audit trail sink: database (batched inserts) or jsonl (append-only segment files in AUDIT_DIR)
+    AUDIT_SINK = os.getenv('AUDIT_SINK', 'database')
+    AUDIT_DIR = os.getenv('AUDIT_DIR', 'audit')
@@ -0,0 +1,301 @@
+#
+# Steps deploying and undeploying an nginx app on the cluster of a cloud provider.
+#
+# The steps are shared by the HTTP endpoints (blocking and streaming) and report their
+# progress as events (see events.py). Each step raises a DeploymentError with the message
+# returned to the client when it fails.
+#
+import json
+import os
+import time
+from datetime import datetime, timezone
+from kubernetes import client
+from dns_manager import create_dns_record, delete_dns_records, delete_routed_dns_endpoint
+from events import (broker, DEPLOYMENT_CREATED, SERVICE_CREATED, INGRESS_CREATED,
+                    IP_ASSIGNED, DNS_COMMITTED, READY, FAILED, UNDEPLOYED)
+from utils import get_api_client, generate_public_url
+import placement
+
+# Number of seconds to wait for the load balancer to assign an IP to the ingress (streaming deploys)
+INGRESS_IP_TIMEOUT = int(os.getenv('INGRESS_IP_TIMEOUT', 300))
+INGRESS_IP_POLL_INTERVAL = 5
+
+
+# Labels and annotations put on every resource created by the platform (see cleanup.py)
+MANAGED_BY_LABEL = "app.kubernetes.io/managed-by"
+MANAGED_BY = "multi-cloud-platform"
+LAST_ACTIVITY_ANNOTATION = "multi-cloud-platform/last-activity"
+# Only apps with this label (set at deploy time) are deleted by the garbage collection when idle
+GC_LABEL = "multi-cloud-platform/gc"
+# Global hostnames routed to an ingress by /global-dns, as JSON {hostname: DNS provider}
+GLOBAL_DNS_ANNOTATION = "multi-cloud-platform/global-dns"
+
+
+class DeploymentError(Exception):
+    pass
+
+
+def platform_metadata(app_name, annotations=None, collectable=False):
+    labels = {"app": app_name, MANAGED_BY_LABEL: MANAGED_BY}
+    if collectable:
+        labels[GC_LABEL] = "true"
+    return client.V1ObjectMeta(
+        name=app_name,
+        labels=labels,
+        annotations={LAST_ACTIVITY_ANNOTATION: datetime.now(timezone.utc).isoformat(), **(annotations or {})},
+    )
+
+
+# Topics on which the events of a deployment are published
+def event_topics(deployment_id, namespace):
+    return [deployment_id, f"namespace:{namespace}"]
+
+
+# Global hostnames routed to an ingress by /global-dns: {hostname: DNS provider}
+def global_dns_hosts(ingress):
+    return json.loads((ingress.metadata.annotations or {}).get(GLOBAL_DNS_ANNOTATION) or "{}")
+
+
+def create_deployment(cloud_provider, namespace, app_name, collectable=False):
+    try:
+        deployment = client.V1Deployment(
+            metadata=platform_metadata(app_name, collectable=collectable),
+            spec=client.V1DeploymentSpec(
+                replicas=1,
+                selector=client.V1LabelSelector(match_labels={"app": app_name}),
+                template=client.V1PodTemplateSpec(
+                    metadata=client.V1ObjectMeta(labels={"app": app_name}),
+                    spec=client.V1PodSpec(
+                        containers=[client.V1Container(name=app_name, image="nginx:latest")] # use the latest version of nginx Docker image available at https://hub.docker.com/_/nginx
+                    )
+                )
+            )
+        )
+        apps_v1 = client.AppsV1Api(api_client=get_api_client(cloud_provider))
+        with placement.track(cloud_provider):
+            apps_v1.create_namespaced_deployment(namespace=namespace, body=deployment)
+    except Exception as e:
+        raise DeploymentError(f"Failed to create deployment: {str(e)}") from e
+
+
+# Create Kubernetes service https://kubernetes.io/docs/concepts/services-networking/service/
+# to expose the nginx application (that is running as one or more Pods) in the cluster.
+def create_service(cloud_provider, namespace, app_name, collectable=False):
+    try:
+        service = client.V1Service(
+            metadata=platform_metadata(app_name, collectable=collectable),
+            spec=client.V1ServiceSpec(
+                selector={"app": app_name},
+                ports=[client.V1ServicePort(port=80, target_port=80)]
+            )
+        )
+        k8s = client.CoreV1Api(api_client=get_api_client(cloud_provider))
+        with placement.track(cloud_provider):
+            k8s.create_namespaced_service(namespace=namespace, body=service)
+    except Exception as e:
+        raise DeploymentError(f"Failed to create service: {str(e)}") from e
+
+
+# Create Kubernetes ingress https://kubernetes.io/docs/concepts/services-networking/ingress/
+# to manage external access to the http service on port 80 in a cluster
+def create_ingress(cloud_provider, namespace, app_name, host, collectable=False):
+    try:
+        ingress = client.V1Ingress(
+            metadata=platform_metadata(app_name, annotations={
+                "nginx.ingress.kubernetes.io/rewrite-target": "/"
+            }, collectable=collectable),
+            spec=client.V1IngressSpec(
+                rules=[client.V1IngressRule(
+                    host=host,
+                    http=client.V1HTTPIngressRuleValue(
+                        paths=[client.V1HTTPIngressPath(
+                            path="/",
+                            path_type="Prefix",
+                            backend=client.V1IngressBackend(
+                                service=client.V1IngressServiceBackend(
+                                    name=app_name,
+                                    port=client.V1ServiceBackendPort(number=80)
+                                )
+                            )
+                        )]
+                    )
+                )]
+            )
+        )
+        networking_v1 = client.NetworkingV1Api(api_client=get_api_client(cloud_provider))
+        with placement.track(cloud_provider):
+            networking_v1.create_namespaced_ingress(namespace=namespace, body=ingress)
+    except Exception as e:
+        raise DeploymentError(f"Failed to create ingress: {str(e)}") from e
+
+
+# Add the global hostname of an app deployed to several clouds to the ingress of the app, routed to
+# the same backend as its existing rule, so that the ingress controller accepts its traffic.
+# The hostname and the DNS provider publishing it are kept in an annotation (to delete the record).
+def add_ingress_host(cloud_provider, namespace, app_name, host, dns_provider):
+    try:
+        networking_v1 = client.NetworkingV1Api(api_client=get_api_client(cloud_provider))
+        with placement.track(cloud_provider):
+            ingress = networking_v1.read_namespaced_ingress(name=app_name, namespace=namespace)
+        rules = ingress.spec.rules or []
+        annotations = ingress.metadata.annotations or {}
+        global_hosts = global_dns_hosts(ingress)
+        if any(rule.host == host for rule in rules) and global_hosts.get(host) == dns_provider:
+            return
+        if not rules:
+            raise ValueError("Ingress has no rule")
+        if not any(rule.host == host for rule in rules):
+            rules.append(client.V1IngressRule(host=host, http=rules[0].http))
+        ingress.spec.rules = rules
+        ingress.metadata.annotations = {**annotations, GLOBAL_DNS_ANNOTATION: json.dumps({**global_hosts, host: dns_provider})}
+        # replace (not patch): rules is replaced as a whole, resourceVersion guards concurrent updates
+        with placement.track(cloud_provider):
+            networking_v1.replace_namespaced_ingress(name=app_name, namespace=namespace, body=ingress)
+    except Exception as e:
+        raise DeploymentError(f"Failed to add host {host} to the ingress on {cloud_provider}: {str(e)}") from e
+
+
+# Retrieve the external IP address of the ingress, polling for up to timeout seconds
+def get_ingress_ip(cloud_provider, namespace, app_name, timeout=0):
+    networking_v1 = client.NetworkingV1Api(api_client=get_api_client(cloud_provider))
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with placement.track(cloud_provider):
+                ingress = networking_v1.read_namespaced_ingress(name=app_name, namespace=namespace)
+            ingress_ip = ingress.status.load_balancer.ingress[0].ip
+            if ingress_ip:
+                return ingress_ip
+            error = "No IP assigned"
+        except Exception as e:
+            error = str(e)
+        if time.monotonic() >= deadline:
+            raise DeploymentError(f"Failed to retrieve ingress IP: {error}")
+        time.sleep(INGRESS_IP_POLL_INTERVAL)
+
+
+def commit_dns_record(cloud_provider, host, ingress_ip):
+    try:
+        create_dns_record(cloud_provider, host, ingress_ip)
+    except Exception as e:
+        raise DeploymentError(f"Failed to create DNS record: {str(e)}") from e
+
+
+# Run every step of a deployment, publishing an event after each of them.
+# ip_timeout is the number of seconds to wait for the ingress IP (0: read it once).
+# collectable apps are deleted by the garbage collection once idle (see cleanup.py).
+def run_deploy(deployment_id, cloud_provider, namespace, app_name, public_url, ip_timeout=0, collectable=False):
+    host = public_url.split("//")[1]
+    topics = event_topics(deployment_id, namespace)
+    info = {"deployment_id": deployment_id, "cloud_provider": cloud_provider, "namespace": namespace, "app_name": app_name}
+    try:
+        create_deployment(cloud_provider, namespace, app_name, collectable)
+        broker.publish(topics, DEPLOYMENT_CREATED, **info)
+
+        create_service(cloud_provider, namespace, app_name, collectable)
+        broker.publish(topics, SERVICE_CREATED, **info)
+
+        create_ingress(cloud_provider, namespace, app_name, host, collectable)
+        broker.publish(topics, INGRESS_CREATED, **info)
+
+        ingress_ip = get_ingress_ip(cloud_provider, namespace, app_name, ip_timeout)
+        broker.publish(topics, IP_ASSIGNED, ingress_ip=ingress_ip, **info)
+
+        commit_dns_record(cloud_provider, host, ingress_ip)
+        broker.publish(topics, DNS_COMMITTED, host=host, **info)
+    except DeploymentError as e:
+        broker.publish(topics, FAILED, error=str(e), **info)
+        raise
+
+    broker.publish(topics, READY, public_url=public_url, **info)
+    return ingress_ip
+
+
+# Read what identifies the DNS records of an app before its ingress is deleted:
+# {"ingress_ip": IP or None when never assigned (no DNS record), "global_hosts": {hostname: DNS provider}}.
+# Fails with a 404 ApiException as cause when there is no ingress.
+def read_ingress_dns(cloud_provider, namespace, app_name):
+    try:
+        networking_v1 = client.NetworkingV1Api(api_client=get_api_client(cloud_provider))
+        ingress = networking_v1.read_namespaced_ingress(name=app_name, namespace=namespace)
+    except Exception as e:
+        raise DeploymentError(f"Failed to read ingress: {str(e)}") from e
+    lb_ingress = ingress.status.load_balancer.ingress if ingress.status and ingress.status.load_balancer else None
+    return {"ingress_ip": lb_ingress[0].ip if lb_ingress and lb_ingress[0].ip else None,
+            "global_hosts": global_dns_hosts(ingress)}
+
+
+# Remove the endpoint of a cloud from the global hostnames routed to the ingress of an app
+# (records possibly hosted by another cloud), so that no traffic is sent to the deleted ingress
+def delete_global_dns_endpoints(cloud_provider, ingress_ip, global_hosts):
+    for hostname, dns_provider in (global_hosts or {}).items():
+        delete_routed_dns_endpoint(dns_provider, hostname, cloud_provider, ingress_ip)
+
+
+# Delete the DNS records of an app: its own A record and its endpoint in its global hostnames
+def delete_app_dns_records(cloud_provider, host, ingress_ip, global_hosts=None):
+    if not ingress_ip:
+        return
+    try:
+        delete_global_dns_endpoints(cloud_provider, ingress_ip, global_hosts)
+        delete_dns_records(cloud_provider, [(host, ingress_ip)])
+    except Exception as e:
+        raise DeploymentError(f"Failed to delete DNS record: {str(e)}") from e
+
+
+def delete_deployment(cloud_provider, namespace, app_name):
+    try:
+        client.AppsV1Api(api_client=get_api_client(cloud_provider)).delete_namespaced_deployment(
+            name=app_name,
+            namespace=namespace,
+            body=client.V1DeleteOptions(propagation_policy="Foreground")
+        )
+    except Exception as e:
+        raise DeploymentError(f"Failed to delete deployment: {str(e)}") from e
+
+
+def delete_service(cloud_provider, namespace, app_name):
+    try:
+        client.CoreV1Api(api_client=get_api_client(cloud_provider)).delete_namespaced_service(
+            name=app_name,
+            namespace=namespace,
+            body=client.V1DeleteOptions(propagation_policy="Foreground")
+        )
+    except Exception as e:
+        raise DeploymentError(f"Failed to delete service: {str(e)}") from e
+
+
+def delete_ingress(cloud_provider, namespace, app_name):
+    try:
+        client.NetworkingV1Api(api_client=get_api_client(cloud_provider)).delete_namespaced_ingress(
+            name=app_name,
+            namespace=namespace,
+            body=client.V1DeleteOptions(propagation_policy="Foreground")
+        )
+    except Exception as e:
+        raise DeploymentError(f"Failed to delete ingress: {str(e)}") from e
+
+
+# Delete the deployment, service, ingress and DNS record of an app
+def run_undeploy(deployment_id, cloud_provider, domain, namespace, app_name):
+    host = generate_public_url(cloud_provider, domain, namespace, app_name).split("//")[1]
+    topics = event_topics(deployment_id, namespace)
+    info = {"deployment_id": deployment_id, "cloud_provider": cloud_provider, "namespace": namespace, "app_name": app_name}
+    try:
+        # Delete the DNS records first: they are found from the IP and annotations of the ingress
+        try:
+            ingress_dns = read_ingress_dns(cloud_provider, namespace, app_name)
+        except DeploymentError as e:
+            if getattr(e.__cause__, "status", None) != 404:
+                raise
+            ingress_dns = {}  # no ingress, no DNS record
+        delete_app_dns_records(cloud_provider, host, ingress_dns.get("ingress_ip"), ingress_dns.get("global_hosts"))
+
+        delete_deployment(cloud_provider, namespace, app_name)
+        delete_service(cloud_provider, namespace, app_name)
+        delete_ingress(cloud_provider, namespace, app_name)
+    except DeploymentError as e:
+        broker.publish(topics, FAILED, error=str(e), **info)
+        raise
+
+    broker.publish(topics, UNDEPLOYED, **info)
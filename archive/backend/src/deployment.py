@@ -1,166 +1,506 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from kubernetes import client, config
-from dns_manager import create_dns_record, delete_dns_record
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Blueprint, request, jsonify, Response, stream_with_context, g
+from kubernetes import client
+from token_auth import role_required, current_identity
+from dns_manager import get_app_endpoints, create_routed_dns_record, DEFAULT_ROUTED_TTL
+from utils import SUPPORTED_CLOUDS, validate_domain, generate_public_url, get_api_client
+from cache import response_cache, cached_response
+from events import broker, format_sse, TERMINAL_EVENTS
+from deploy_steps import DeploymentError, run_deploy, run_undeploy, add_ingress_host, INGRESS_IP_TIMEOUT
+from jobs import enqueue_job, job_to_dict
+from models import db, DeploymentJob
+from audit import audit_log
+import cleanup
+import placement
 
 deployment_bp = Blueprint('deployment', __name__)
 
-# Protected endpoint to deploy Nginx app
-@app.route('/deploy', methods=['POST'])
-@jwt_required()  # Protect this endpoint with JWT authentication
-def deploy():
-    # Get the current user's identity from the JWT
-    current_user = get_jwt_identity()
-    if current_user['role'] != 'dev' and current_user['role'] != 'admin': # as defined in the spec, only dev and admin are allowed in the platform
-        return jsonify({"error": "Unauthorized"}), 403
+# Seconds between two keep-alive comments on an idle event stream
+STREAM_HEARTBEAT = 15
+# Event streams served at once by a process. Each open stream holds a gunicorn thread, so the cap is
+# kept below the number of threads (see Dockerfile) to leave threads for the other requests.
+MAX_EVENT_STREAMS = int(os.getenv('MAX_EVENT_STREAMS', 32))
+# Seconds after which a stream is ended, giving its thread back. EventSource clients reconnect
+# with Last-Event-ID and get the events published in between from the history of the topic.
+STREAM_MAX_DURATION = int(os.getenv('STREAM_MAX_DURATION', 300))
+
+_stream_slots = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+# Invalidate the cached read responses of a tenant on each of its deployment events
+# (a failed deploy may still have created some of the resources).
+broker.add_listener(lambda event: response_cache.invalidate(event["namespace"]))
+
+# Audited endpoints and the action they are recorded as
+AUDITED_ENDPOINTS = {
+    'deployment.deploy': 'deploy',
+    'deployment.deploy_stream': 'deploy_stream',
+    'deployment.undeploy': 'undeploy',
+    'deployment.create_job': 'create_job',
+    'deployment.global_dns': 'global_dns',
+    'deployment.garbage_collect': 'gc',
+}
 
+# Record who called a mutating endpoint, on what and with which outcome.
+# The event is buffered and written in batches by audit_log, not in the request.
+# The outcome of a streamed deployment is only known at its end: it is recorded by deploy_stream.
+@deployment_bp.after_request
+def audit_request(response):
+    action = AUDITED_ENDPOINTS.get(request.endpoint)
+    if action and not response.is_streamed:
+        params = request.get_json(silent=True) or {}
+        result = response.get_json(silent=True) or {}
+        claims = getattr(g, 'jwt_claims', None)
+        if action == 'gc':
+            # A collection is not about one app and covers every namespace when none is given
+            scope = {"app_name": None, "namespace": params.get('namespace'), "dry_run": result.get('dry_run'),
+                     "deleted": [name for report in result.get('reports', []) for name in report.get('deleted', [])] or None}
+        else:
+            scope = {"app_name": params.get('appname', 'default-app'), "namespace": params.get('namespace', 'default')}
+        audit_log.record(
+            params.get('kind', action) if action == 'create_job' else action,
+            username=claims['sub']['username'] if claims else None,
+            cloud_provider=result.get('cloud_provider') or params.get('cloud_provider'),
+            status=response.status_code,
+            deployment_id=result.get('deployment_id'),
+            job_id=result.get('job_id'),
+            error=result.get('error'),
+            **scope,
+        )
+    return response
+
+# Validate the inputs of a deploy request.
+# Returns the deployment parameters, or an error response.
+def parse_deploy_request():
     # Validate inputs
-    cloud_provider = request.json.get('cloud_provider', 'aws')  # Default to AWS
+    cloud_provider = request.json.get('cloud_provider', 'auto')  # Default to latency-aware placement
     domain = request.json.get('domain', 'example.com')
     namespace = request.json.get('namespace', 'default') # If no namespace is specified, default namespace is used
     app_name = request.json.get('appname', 'default-app') # If no app is specified, default-app is used
-    
+    # Garbage collected once idle (see cleanup.py): opt-in, except for the throwaway default-app deployments
+    collectable = request.json.get('gc', 'appname' not in request.json)
+
     if not validate_domain(domain):
-        return jsonify({"error": "Invalid domain"}), 400
+        return None, (jsonify({"error": "Invalid domain"}), 400)
+    if not isinstance(collectable, bool):
+        return None, (jsonify({"error": "Invalid gc flag"}), 400)
 
-    if cloud_provider not in ["aws", "gcp", "azure"]:
-        return jsonify({"error": "Unsupported cloud provider"}), 400
+    # Place the app on the best scored cloud when no cloud provider is given
+    placement_decision = {"mode": "explicit", "cloud_provider": cloud_provider}
+    if cloud_provider == "auto":
+        cloud_provider, placement_decision = placement.choose_cloud_provider()
+
+    if cloud_provider not in SUPPORTED_CLOUDS:
+        return None, (jsonify({"error": "Unsupported cloud provider"}), 400)
 
     # Load Kubernetes config for the specified cloud provider
     try:
-        config.load_kube_config(context=cloud_provider)
+        get_api_client(cloud_provider)
     except Exception as e:
-        return jsonify({"error": f"Failed to load Kubernetes config: {str(e)}"}), 500
+        return None, (jsonify({"error": f"Failed to load Kubernetes config: {str(e)}"}), 500)
 
     # Generate a unique app name and public URL
     #app_name = generate_app_name()
     public_url = generate_public_url(cloud_provider, domain, namespace, app_name)
 
-    # Create Kubernetes deployment
-    try:
-        deployment = client.V1Deployment(
-            metadata=client.V1ObjectMeta(name=app_name),
-            spec=client.V1DeploymentSpec(
-                replicas=1,
-                selector=client.V1LabelSelector(match_labels={"app": app_name}),
-                template=client.V1PodTemplateSpec(
-                    metadata=client.V1ObjectMeta(labels={"app": app_name}),
-                    spec=client.V1PodSpec(
-                        containers=[client.V1Container(name=app_name, image="nginx:latest")] # use the latest version of nginx Docker image available at https://hub.docker.com/_/nginx 
-                    )
-                )
-            )
-        )
-        apps_v1 = client.AppsV1Api()
-        apps_v1.create_namespaced_deployment(namespace=namespace, body=deployment)
-    except Exception as e:
-        return jsonify({"error": f"Failed to create deployment: {str(e)}"}), 500
+    return {
+        "deployment_id": str(uuid.uuid4()),
+        "cloud_provider": cloud_provider,
+        "namespace": namespace,
+        "app_name": app_name,
+        "public_url": public_url,
+        "placement": placement_decision,
+        "collectable": collectable,
+    }, None
 
-    # Create Kubernetes service https://kubernetes.io/docs/concepts/services-networking/service/
-    # to expose the nginx application (that is running as one or more Pods) in the cluster.
-    try:
-        service = client.V1Service(
-            metadata=client.V1ObjectMeta(name=app_name),
-            spec=client.V1ServiceSpec(
-                selector={"app": app_name},
-                ports=[client.V1ServicePort(port=80, target_port=80)]
-            )
-        )
-        k8s = client.CoreV1Api()
-        k8s.create_namespaced_service(namespace=namespace, body=service)
-    except Exception as e:
-        return jsonify({"error": f"Failed to create service: {str(e)}"}), 500
+# Cloud provider of a request about an existing app. Deploys are placed automatically when no cloud
+# provider is given, so when none is given here either the app is looked up on every cloud.
+# Returns the cloud provider, or an error response.
+def resolve_cloud_provider(cloud_provider, namespace, app_name):
+    if cloud_provider:
+        if cloud_provider not in SUPPORTED_CLOUDS:
+            return None, (jsonify({"error": "Unsupported cloud provider"}), 400)
+        return cloud_provider, None
+
+    found = []
+    for provider in SUPPORTED_CLOUDS:
+        try:
+            client.AppsV1Api(api_client=get_api_client(provider)).read_namespaced_deployment(name=app_name, namespace=namespace)
+        except Exception as e:
+            if getattr(e, 'status', None) == 404:
+                continue  # not deployed on this cloud
+            return None, (jsonify({"error": f"Failed to locate app {app_name} on {provider}: {str(e)}"}), 500)
+        found.append(provider)
 
-    # Create Kubernetes ingress https://kubernetes.io/docs/concepts/services-networking/ingress/
-    # to manage external access to the http service on port 80 in a cluster
+    if not found:
+        return None, (jsonify({"error": f"App {app_name} is not deployed on any cloud"}), 404)
+    if len(found) > 1:
+        return None, (jsonify({"error": f"App {app_name} is deployed on {', '.join(found)}: cloud_provider is required"}), 400)
+    return found[0], None
+
+# Stream the events of the given topics as server-sent events until a terminal event (never for a
+# namespace stream) or for at most max_duration seconds. A comment is sent when idle to keep the
+# connection open.
+def stream_events(subscription, until_terminal=True, max_duration=STREAM_MAX_DURATION):
+    deadline = time.monotonic() + max_duration
     try:
-        ingress = client.V1Ingress(
-            metadata=client.V1ObjectMeta(name=app_name, annotations={
-                "nginx.ingress.kubernetes.io/rewrite-target": "/"
-            }),
-            spec=client.V1IngressSpec(
-                rules=[client.V1IngressRule(
-                    host=public_url.split("//")[1],
-                    http=client.V1HTTPIngressRuleValue(
-                        paths=[client.V1HTTPIngressPath(
-                            path="/",
-                            path_type="Prefix",
-                            backend=client.V1IngressBackend(
-                                service=client.V1IngressServiceBackend(
-                                    name=app_name,
-                                    port=client.V1ServiceBackendPort(number=80)
-                                )
-                            )
-                        )]
-                    )
-                )]
-            )
-        )
-        networking_v1 = client.NetworkingV1Api()
-        networking_v1.create_namespaced_ingress(namespace=namespace, body=ingress)
-    except Exception as e:
-        return jsonify({"error": f"Failed to create ingress: {str(e)}"}), 500
-    
-    # Retrieve the external IP address of the ingress
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event = subscription.get(timeout=min(STREAM_HEARTBEAT, remaining))
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event)
+            if until_terminal and event["type"] in TERMINAL_EVENTS:
+                return
+    finally:
+        subscription.close()
+
+# Response streaming the events of a subscription, holding one of the MAX_EVENT_STREAMS slots
+# (acquired with acquire_stream_slot) until the client is gone or the stream ends
+def event_stream_response(subscription, until_terminal=True):
+    response = Response(stream_with_context(stream_events(subscription, until_terminal)), mimetype='text/event-stream')
+    response.call_on_close(_stream_slots.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # disable proxy buffering (nginx ingress)
+    return response
+
+def acquire_stream_slot():
+    return _stream_slots.acquire(blocking=False)
+
+def too_many_streams():
+    return jsonify({"error": "Too many open event streams, retry later"}), 503, {"Retry-After": "5"}
+
+# Last-Event-ID sent by a reconnecting EventSource client
+def last_event_id():
+    value = request.headers.get('Last-Event-ID')
+    return int(value) if value and value.isdigit() else None
+
+# Protected endpoint to deploy Nginx app
+@deployment_bp.route('/deploy', methods=['POST'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
+def deploy():
+    params, error = parse_deploy_request()
+    if error:
+        return error
+
     try:
-        ingress_ip = networking_v1.read_namespaced_ingress(
-            name=app_name, namespace=namespace
-        ).status.load_balancer.ingress[0].ip
-    except Exception as e:
-        return jsonify({"error": f"Failed to retrieve ingress IP: {str(e)}"}), 500
+        run_deploy(params["deployment_id"], params["cloud_provider"], params["namespace"], params["app_name"], params["public_url"],
+                   collectable=params["collectable"])
+    except DeploymentError as e:
+        return jsonify({"error": str(e), "deployment_id": params["deployment_id"]}), 500
 
-    create_dns_record(cloud_provider, public_url, ingress_ip)
+    return jsonify({"status": "Deployment created", "deployment_id": params["deployment_id"], "public_url": params["public_url"], "cloud_provider": params["cloud_provider"], "placement": params["placement"]})
 
-    return jsonify({"status": "Deployment created", "public_url": public_url})
+# Protected endpoint to deploy Nginx app, streaming its progress as server-sent events
+# (deployment_created, service_created, ingress_created, ip_assigned, dns_committed, ready or failed).
+# The deployment runs in a background thread, so gunicorn should use threaded workers.
+@deployment_bp.route('/deploy/stream', methods=['POST'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
+def deploy_stream():
+    params, error = parse_deploy_request()
+    if error:
+        return error
+    if not acquire_stream_slot():
+        return too_many_streams()
+
+    # Subscribe before starting so that no event is missed
+    subscription = broker.subscribe(params["deployment_id"])
+    username = current_identity()['username']
+
+    # Audited here with the outcome of the deployment (see audit_request)
+    def run():
+        status, error = 200, None
+        try:
+            run_deploy(params["deployment_id"], params["cloud_provider"], params["namespace"], params["app_name"], params["public_url"],
+                       INGRESS_IP_TIMEOUT, params["collectable"])
+        except DeploymentError as e:
+            status, error = 500, str(e)  # also published as a failed event
+        audit_log.record('deploy_stream', username=username, app_name=params["app_name"], namespace=params["namespace"],
+                         cloud_provider=params["cloud_provider"], status=status, deployment_id=params["deployment_id"], error=error)
+    threading.Thread(target=run, daemon=True).start()
+
+    response = event_stream_response(subscription)
+    response.headers['X-Deployment-Id'] = params["deployment_id"]
+    return response
+
+# Endpoint to follow the events of a deployment started elsewhere (e.g. by /deploy).
+# Events already published are replayed.
+@deployment_bp.route('/events/<deployment_id>', methods=['GET'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
+def deployment_events(deployment_id):
+    if not acquire_stream_slot():
+        return too_many_streams()
+    subscription = broker.subscribe(deployment_id, last_event_id=last_event_id() or 0)
+    return event_stream_response(subscription)
+
+# Endpoint to follow every deployment event of a namespace
+@deployment_bp.route('/events', methods=['GET'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
+def namespace_events():
+    namespace = request.args.get('namespace', 'default') # If no namespace is specified, default namespace is used
+    if not acquire_stream_slot():
+        return too_many_streams()
+    subscription = broker.subscribe(f"namespace:{namespace}", last_event_id=last_event_id())
+    return event_stream_response(subscription, until_terminal=False)
 
 # Endpoint to Undeploy an nginx app
-@app.route('/undeploy', methods=['POST'])
-@jwt_required()  # Protect this endpoint with JWT authentication
+@deployment_bp.route('/undeploy', methods=['POST'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
 def undeploy():
-    # Get the current user's identity from the JWT
-    current_user = get_jwt_identity()
-    if current_user['role'] != 'dev' and current_user['role'] != 'admin': # as defined in the spec, only dev and admin are allowed in the platform
-        return jsonify({"error": "Unauthorized"}), 403
-
-    cloud_provider = request.json.get('cloud_provider', 'aws')  # Default to AWS
     domain = request.json.get('domain', 'example.com')
     namespace = request.json.get('namespace', 'default') # If no namespace is specified, default namespace is used
     app_name = request.json.get('appname', 'default-app') # If no app is specified, default-app is used
+    # If no cloud provider is specified, the cloud where the app runs
+    cloud_provider, error = resolve_cloud_provider(request.json.get('cloud_provider'), namespace, app_name)
+    if error:
+        return error
 
-    # Delete the Kubernetes deployment
     try:
-        apps_v1 = client.AppsV1Api()
-        apps_v1.delete_namespaced_deployment(
-            name=app_name,
-            namespace=namespace,
-            body=client.V1DeleteOptions(propagation_policy="Foreground")
-        )
+        run_undeploy(str(uuid.uuid4()), cloud_provider, domain, namespace, app_name)
+    except DeploymentError as e:
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"status": "Undeployment successful", "app_name": app_name, "namespace": namespace, "domain": domain, "cloud_provider": cloud_provider})
+
+# Endpoint to queue a deploy or undeploy job, executed by a worker process (see worker.py).
+# Returns immediately with the id of the job.
+@deployment_bp.route('/jobs', methods=['POST'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
+def create_job():
+    kind = request.json.get('kind', 'deploy') # deploy or undeploy
+    if kind == 'deploy':
+        params, error = parse_deploy_request()
+        if error:
+            return error
+    elif kind == 'undeploy':
+        params = {
+            "deployment_id": str(uuid.uuid4()),  # topic of the events of the job (see /events/<deployment_id>)
+            "domain": request.json.get('domain', 'example.com'),
+            "namespace": request.json.get('namespace', 'default'), # If no namespace is specified, default namespace is used
+            "app_name": request.json.get('appname', 'default-app'), # If no app is specified, default-app is used
+        }
+        # If no cloud provider is specified, the cloud where the app runs
+        params["cloud_provider"], error = resolve_cloud_provider(request.json.get('cloud_provider'), params["namespace"], params["app_name"])
+        if error:
+            return error
+    else:
+        return jsonify({"error": f"Unsupported job kind: {kind}"}), 400
+
+    try:
+        job = enqueue_job(kind, params, created_by=current_identity()['username'])
     except Exception as e:
-        return jsonify({"error": f"Failed to delete deployment: {str(e)}"}), 500
+        db.session.rollback()
+        return jsonify({"error": f"Failed to queue job: {str(e)}"}), 500
+
+    return jsonify({"status": "Job queued", "deployment_id": params["deployment_id"], **job_to_dict(job)}), 202
+
+# Endpoint to get the status and checkpoint of a job
+@deployment_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
+def get_job(job_id):
+    job = db.session.get(DeploymentJob, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_to_dict(job))
+
+# Endpoint to publish one hostname for an app deployed to several clouds.
+# The hostname namespace.appname.domain is routed (weighted or latency based) to the
+# ingress of the app on every cloud where it runs.
+@deployment_bp.route('/global-dns', methods=['POST'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
+def global_dns():
+    dns_provider = request.json.get('dns_provider', 'aws')  # Cloud hosting the DNS zone of the domain
+    domain = request.json.get('domain', 'example.com')
+    namespace = request.json.get('namespace', 'default') # If no namespace is specified, default namespace is used
+    app_name = request.json.get('appname', 'default-app') # If no app is specified, default-app is used
+    routing_policy = request.json.get('routing_policy', 'weighted') # weighted or latency
+    ttl = request.json.get('ttl', DEFAULT_ROUTED_TTL)
+    weights = request.json.get('weights', {}) # e.g. {"aws": 2, "gcp": 1}
+    regions = request.json.get('regions', {}) # e.g. {"aws": "eu-central-1", "gcp": "europe-west6"}, required for latency routing
+    health_check = request.json.get('health_check') # e.g. {"path": "/", "port": 80, "interval": 30}
+
+    if not validate_domain(domain):
+        return jsonify({"error": "Invalid domain"}), 400
+
+    if dns_provider not in SUPPORTED_CLOUDS:
+        return jsonify({"error": "Unsupported cloud provider"}), 400
 
-    # Delete the Kubernetes service
     try:
-        core_v1 = client.CoreV1Api()
-        core_v1.delete_namespaced_service(
-            name=app_name,
-            namespace=namespace,
-            body=client.V1DeleteOptions(propagation_policy="Foreground")
-        )
+        ttl = int(ttl)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid ttl"}), 400
+    if ttl <= 0:
+        return jsonify({"error": "Invalid ttl"}), 400
+
+    endpoints = get_app_endpoints(namespace, app_name)
+    if not endpoints:
+        return jsonify({"error": f"App {app_name} is not running on any cloud"}), 404
+    for endpoint in endpoints:
+        endpoint["weight"] = weights.get(endpoint["cloud_provider"], 1)
+        endpoint["region"] = regions.get(endpoint["cloud_provider"])
+
+    # The ingress of every cloud must accept the global hostname before traffic is routed to it
+    hostname = f"{namespace}.{app_name}.{domain}"
+    try:
+        for endpoint in endpoints:
+            add_ingress_host(endpoint["cloud_provider"], namespace, app_name, hostname, dns_provider)
+    except DeploymentError as e:
+        return jsonify({"error": str(e)}), 500
+
+    try:
+        create_routed_dns_record(dns_provider, hostname, endpoints, routing_policy, ttl, health_check)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": f"Failed to delete service: {str(e)}"}), 500
+        return jsonify({"error": f"Failed to create DNS record: {str(e)}"}), 500
+
+    return jsonify({"status": "DNS record created", "public_url": f"http://{hostname}", "routing_policy": routing_policy, "ttl": ttl, "endpoints": endpoints})
+
+# Endpoint to list the apps deployed in a namespace, on one cloud or on all of them.
+# Responses are cached per namespace and query, see cache.py
+@deployment_bp.route('/deployments', methods=['GET'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
+@cached_response
+def list_deployments():
+    namespace = request.args.get('namespace', 'default') # If no namespace is specified, default namespace is used
+    cloud_provider = request.args.get('cloud_provider') # If no cloud provider is specified, all clouds are listed
+
+    if cloud_provider and cloud_provider not in SUPPORTED_CLOUDS:
+        return jsonify({"error": "Unsupported cloud provider"}), 400
+
+    deployments = []
+    for provider in [cloud_provider] if cloud_provider else SUPPORTED_CLOUDS:
+        try:
+            apps_v1 = client.AppsV1Api(api_client=get_api_client(provider))
+            items = apps_v1.list_namespaced_deployment(namespace=namespace).items
+        except Exception as e:
+            return jsonify({"error": f"Failed to list deployments: {str(e)}"}), 500
+        for item in items:
+            deployments.append({
+                "app_name": item.metadata.name,
+                "cloud_provider": provider,
+                "replicas": item.spec.replicas,
+                "ready_replicas": item.status.ready_replicas or 0,
+            })
+
+    return jsonify({"namespace": namespace, "deployments": deployments})
+
+# Record the access to the app of the query as activity (see cleanup.py), cached response or not.
+# Without a cloud provider in the query, the cloud resolved by the view is used (unknown, and the
+# access not recorded, on a cache hit: touches are throttled anyway, see cleanup.touch_app).
+def records_activity(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = view(*args, **kwargs)
+        cloud_provider = request.args.get('cloud_provider') or g.get('cloud_provider')
+        if response.status_code in (200, 304) and cloud_provider:
+            cleanup.touch_app(cloud_provider, request.args.get('namespace', 'default'), request.args.get('appname', 'default-app'))
+        return response
+    return wrapper
+
+# Endpoint to get the status of an app: replicas and external IP of its ingress.
+# Responses are cached per namespace and query, see cache.py
+@deployment_bp.route('/status', methods=['GET'])
+@role_required('dev', 'admin')  # as defined in the spec, only dev and admin are allowed in the platform
+@records_activity
+@cached_response
+def status():
+    namespace = request.args.get('namespace', 'default') # If no namespace is specified, default namespace is used
+    app_name = request.args.get('appname', 'default-app') # If no app is specified, default-app is used
+    # If no cloud provider is specified, the cloud where the app runs
+    cloud_provider, error = resolve_cloud_provider(request.args.get('cloud_provider'), namespace, app_name)
+    if error:
+        return error
+    g.cloud_provider = cloud_provider
 
-    # Delete the Kubernetes ingress
     try:
-        networking_v1 = client.NetworkingV1Api()
-        networking_v1.delete_namespaced_ingress(
-            name=app_name,
-            namespace=namespace,
-            body=client.V1DeleteOptions(propagation_policy="Foreground")
-        )
+        api_client = get_api_client(cloud_provider)
+        deployment = client.AppsV1Api(api_client=api_client).read_namespaced_deployment(name=app_name, namespace=namespace)
     except Exception as e:
-        return jsonify({"error": f"Failed to delete ingress: {str(e)}"}), 500
+        return jsonify({"error": f"Failed to read deployment: {str(e)}"}), 500
+
+    ingress_ip = None
+    try:
+        ingress = client.NetworkingV1Api(api_client=api_client).read_namespaced_ingress(name=app_name, namespace=namespace)
+        ingress_ip = ingress.status.load_balancer.ingress[0].ip
+    except Exception:
+        pass  # no ingress or no IP assigned yet
+
+    ready_replicas = deployment.status.ready_replicas or 0
+    return jsonify({
+        "app_name": app_name,
+        "namespace": namespace,
+        "cloud_provider": cloud_provider,
+        "replicas": deployment.spec.replicas,
+        "ready_replicas": ready_replicas,
+        "ingress_ip": ingress_ip,
+        "ready": ready_replicas >= (deployment.spec.replicas or 0) and ingress_ip is not None,
+    })
 
-    # Delete the DNS record
-    delete_dns_record(cloud_provider, domain, namespace, app_name)
-    return jsonify({"status": "Undeployment successful", "app_name": app_name, "namespace": namespace, "domain": domain, "cloud_provider": cloud_provider})    
+# Endpoint to list the apps created by the platform with their activity, in a namespace or in all of them
+@deployment_bp.route('/admin/apps', methods=['GET'])
+@role_required('admin')  # only admins can see every tenant
+def platform_apps():
+    cloud_provider = request.args.get('cloud_provider') # If no cloud provider is specified, all clouds are listed
+    namespace = request.args.get('namespace') # If no namespace is specified, all namespaces are listed
+
+    if cloud_provider and cloud_provider not in SUPPORTED_CLOUDS:
+        return jsonify({"error": "Unsupported cloud provider"}), 400
+
+    apps = []
+    for provider in [cloud_provider] if cloud_provider else SUPPORTED_CLOUDS:
+        try:
+            apps += cleanup.list_platform_apps(provider, namespace)
+        except Exception as e:
+            return jsonify({"error": f"Failed to list apps: {str(e)}"}), 500
+    return jsonify({"apps": apps})
+
+# Endpoint to mark idle apps and delete, in bulk, the ones idle for longer than the grace period
+# (see cleanup.py, also run as a scheduled job)
+@deployment_bp.route('/admin/gc', methods=['POST'])
+@role_required('admin')  # only admins can delete the apps of other tenants
+def garbage_collect():
+    params = request.get_json(silent=True) or {}
+    cloud_provider = params.get('cloud_provider') # If no cloud provider is specified, all clouds are collected
+    namespace = params.get('namespace') # If no namespace is specified, all namespaces are collected
+    ttl_hours = float(params.get('ttl_hours', cleanup.IDLE_TTL_HOURS))
+    grace_hours = float(params.get('grace_hours', cleanup.GRACE_HOURS))
+    dry_run = bool(params.get('dry_run', False))
+
+    if cloud_provider and cloud_provider not in SUPPORTED_CLOUDS:
+        return jsonify({"error": "Unsupported cloud provider"}), 400
+
+    reports = []
+    for provider in [cloud_provider] if cloud_provider else SUPPORTED_CLOUDS:
+        try:
+            reports.append(cleanup.collect(provider, namespace, ttl_hours, grace_hours, dry_run))
+        except Exception as e:
+            reports.append({"cloud_provider": provider, "error": f"Failed to collect apps: {str(e)}"})
+    return jsonify({"dry_run": dry_run, "reports": reports})
+
+# Endpoint to query the audit trail by user, app and time (ISO 8601), newest first
+@deployment_bp.route('/audit', methods=['GET'])
+@role_required('admin')  # only admins can read the audit trail
+def audit():
+    try:
+        since, until = [datetime.fromisoformat(request.args[arg]) if request.args.get(arg) else None for arg in ('since', 'until')]
+        since, until = [t.replace(tzinfo=timezone.utc) if t and t.tzinfo is None else t for t in (since, until)]
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {str(e)}"}), 400
 
+    events = audit_log.query(
+        username=request.args.get('username'),
+        app_name=request.args.get('appname'),
+        since=since,
+        until=until,
+        limit=limit,
+    )
+    return jsonify({"events": events})
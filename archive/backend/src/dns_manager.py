@@ -3,32 +3,73 @@ import boto3
 from google.cloud import dns
 from azure.mgmt.dns import DnsManagementClient
 from azure.identity import DefaultAzureCredential
+from azure.mgmt.trafficmanager import TrafficManagerManagementClient
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
 from kubernetes import client, config
+from utils import SUPPORTED_CLOUDS, get_api_client
 
+ROUTING_POLICIES = ["weighted", "latency"]
+DEFAULT_ROUTED_TTL = 60
 
-# Create DNS record for a given cloud provider and domain.
 
+# Create DNS record for a given cloud provider and domain.
 def create_dns_record(provider, domain, ip_address):
+    return upsert_dns_record(provider, domain, ip_address)
+
+
+# Create or replace the A record of a domain in a single call, so that it is idempotent
+# (no list/delete/create round trips). zone defaults to the zone configured for the provider,
+# project (gcp) to GCP_PROJECT_ID or the project of the default credentials.
+def upsert_dns_record(provider, domain, ip_address, ttl=300, zone=None, project=None):
     if provider == "aws":
-        client = boto3.client('route53')
-        hosted_zone_id = os.getenv('AWS_HOSTED_ZONE_ID')
-        client.change_resource_record_sets(
-            HostedZoneId=hosted_zone_id,
+        route53 = boto3.client('route53')
+        return route53.change_resource_record_sets(
+            HostedZoneId=zone or os.getenv('AWS_HOSTED_ZONE_ID'),
             ChangeBatch={'Changes': [{'Action': 'UPSERT', 'ResourceRecordSet': {
-                'Name': domain, 'Type': 'A', 'TTL': 300, 'ResourceRecords': [{'Value': ip_address}]
+                'Name': domain, 'Type': 'A', 'TTL': ttl, 'ResourceRecords': [{'Value': ip_address}]
             }}]}
         )
     elif provider == "gcp":
-        client = dns.Client()
-        zone = client.zone(os.getenv('GCP_DNS_ZONE_NAME'))
-        record_set = zone.resource_record_set(domain, 'A', 300, [ip_address])
-        changes = zone.changes()
-        changes.add_record_set(record_set)
-        changes.create()
+        name = domain if domain.endswith('.') else f"{domain}."
+        return _upsert_gcp_record_set({"name": name, "type": "A", "ttl": ttl, "rrdatas": [ip_address]}, zone, project)
     elif provider == "azure":
         credential = DefaultAzureCredential()
         dns_client = DnsManagementClient(credential, os.getenv('AZURE_SUBSCRIPTION_ID'))
-        dns_client.record_sets.delete(os.getenv('AZURE_DNS_RESOURCE_GROUP'), os.getenv('AZURE_DNS_ZONE_NAME'), domain, 'A')
+        zone = zone or os.getenv('AZURE_DNS_ZONE_NAME')
+        return dns_client.record_sets.create_or_update(
+            os.getenv('AZURE_DNS_RESOURCE_GROUP'), zone, _azure_record_name(domain, zone), 'A',
+            {"ttl": ttl, "arecords": [{"ipv4_address": ip_address}]}
+        )
+    else:
+        raise ValueError(f"Unsupported cloud provider: {provider}")
+
+
+# Azure DNS record sets are named relative to their zone (api.example.com. in example.com -> api)
+def _azure_record_name(domain, zone):
+    domain, zone = domain.rstrip('.'), zone.rstrip('.')
+    if domain == zone:
+        return '@'
+    return domain[:-len(zone) - 1] if domain.endswith(f".{zone}") else domain
+
+
+# Session and URL of the record sets of a Cloud DNS zone (REST API: the google-cloud-dns client
+# has no upsert, no single record set get/delete and no routing policies)
+def _gcp_rrsets(zone=None, project=None):
+    credentials, default_project = google.auth.default(scopes=["https://www.googleapis.com/auth/ndev.clouddns.readwrite"])
+    project = project or os.getenv('GCP_PROJECT_ID', default_project)
+    url = f"https://dns.googleapis.com/dns/v1/projects/{project}/managedZones/{zone or os.getenv('GCP_DNS_ZONE_NAME')}/rrsets"
+    return AuthorizedSession(credentials), url
+
+
+# Upsert a record set with the Cloud DNS REST API: patch it, create it if it does not exist yet.
+def _upsert_gcp_record_set(record_set, zone=None, project=None):
+    session, url = _gcp_rrsets(zone, project)
+    response = session.patch(f"{url}/{record_set['name']}/{record_set['type']}", json=record_set)
+    if response.status_code == 404:
+        response = session.post(url, json=record_set)
+    response.raise_for_status()
+    return response.json()
 
 
 # Delete DNS record for a given cloud provider and domain.
@@ -36,7 +77,7 @@ def delete_dns_record(provider, domain, namespace, app_name):
 
     try:
         # Get the external IP address of the ingress corresponding to the app_name in the given namespace
-        networking_v1 = client.NetworkingV1Api()
+        networking_v1 = client.NetworkingV1Api(api_client=get_api_client(provider))
         ingress = networking_v1.read_namespaced_ingress(
             name=app_name, namespace=namespace
         )
@@ -47,9 +88,9 @@ def delete_dns_record(provider, domain, namespace, app_name):
 
         if provider == "aws":
             hosted_zone_id = os.getenv('AWS_HOSTED_ZONE_ID')
-            client = boto3.client('route53')
+            route53 = boto3.client('route53')
 
-            response = client.change_resource_record_sets(
+            response = route53.change_resource_record_sets(
                 HostedZoneId=hosted_zone_id,
                 ChangeBatch={
                     'Changes': [
@@ -68,8 +109,8 @@ def delete_dns_record(provider, domain, namespace, app_name):
             return response
 
         elif provider == "gcp":
-            client = dns.Client()
-            zone = client.zone(os.getenv('GCP_DNS_ZONE_NAME'))
+            dns_client = dns.Client()
+            zone = dns_client.zone(os.getenv('GCP_DNS_ZONE_NAME'))
 
             record_set = zone.resource_record_set(domain, 'A', 300, [ingress_ip])
             changes = zone.changes()
@@ -94,3 +135,269 @@ def delete_dns_record(provider, domain, namespace, app_name):
     except Exception as e:
         return {"error": f"Failed to delete DNS record: {str(e)}"}
 
+
+
+# Delete several A records at once: records is a list of (domain, ip_address).
+# Route53 and Cloud DNS delete them in a single change, Azure has no batch API. A change is applied
+# all or nothing and fails if one record is already gone (or has another TTL): the records are then
+# deleted one by one, as they currently are, skipping the missing ones.
+def delete_dns_records(provider, records, ttl=300):
+    if not records:
+        return None
+    if provider == "aws":
+        route53 = boto3.client('route53')
+        zone_id = os.getenv('AWS_HOSTED_ZONE_ID')
+        try:
+            return route53.change_resource_record_sets(
+                HostedZoneId=zone_id,
+                ChangeBatch={'Changes': [{'Action': 'DELETE', 'ResourceRecordSet': {
+                    'Name': domain, 'Type': 'A', 'TTL': ttl, 'ResourceRecords': [{'Value': ip_address}]
+                }} for domain, ip_address in records]}
+            )
+        except Exception:
+            pass
+        for domain, ip_address in records:
+            for record_set in _find_route53_record_sets(route53, zone_id, domain):
+                values = [r['Value'] for r in record_set.get('ResourceRecords', [])]
+                if 'SetIdentifier' not in record_set and ip_address in values:
+                    route53.change_resource_record_sets(HostedZoneId=zone_id, ChangeBatch={'Changes': [
+                        {'Action': 'DELETE', 'ResourceRecordSet': record_set}]})
+        return None
+    elif provider == "gcp":
+        try:
+            dns_client = dns.Client()
+            zone = dns_client.zone(os.getenv('GCP_DNS_ZONE_NAME'))
+            changes = zone.changes()
+            for domain, ip_address in records:
+                name = domain if domain.endswith('.') else f"{domain}."
+                changes.delete_record_set(zone.resource_record_set(name, 'A', ttl, [ip_address]))
+            changes.create()
+            return changes
+        except Exception:
+            pass
+        session, url = _gcp_rrsets()
+        for domain, ip_address in records:
+            name = domain if domain.endswith('.') else f"{domain}."
+            response = session.get(f"{url}/{name}/A")
+            if response.status_code == 404:
+                continue
+            response.raise_for_status()
+            if ip_address in response.json().get("rrdatas", []):
+                response = session.delete(f"{url}/{name}/A")
+                if response.status_code != 404:
+                    response.raise_for_status()
+        return None
+    elif provider == "azure":
+        credential = DefaultAzureCredential()
+        dns_client = DnsManagementClient(credential, os.getenv('AZURE_SUBSCRIPTION_ID'))
+        zone_name = os.getenv('AZURE_DNS_ZONE_NAME')
+        for domain, _ in records:
+            # deleting a missing record set succeeds
+            dns_client.record_sets.delete(os.getenv('AZURE_DNS_RESOURCE_GROUP'), zone_name, _azure_record_name(domain, zone_name), 'A')
+        return None
+    else:
+        raise ValueError(f"Unsupported cloud provider: {provider}")
+
+
+# The record sets of a name and type in a Route53 zone, with their current TTL and values
+def _find_route53_record_sets(route53, zone_id, name, record_type='A'):
+    name = name if name.endswith('.') else f"{name}."
+    response = route53.list_resource_record_sets(HostedZoneId=zone_id, StartRecordName=name,
+                                                 StartRecordType=record_type, MaxItems='100')
+    return [rs for rs in response['ResourceRecordSets'] if rs['Name'] == name and rs['Type'] == record_type]
+
+
+# Remove the endpoint of one cloud from a hostname published by create_routed_dns_record.
+# The record (and its health checks, Traffic Manager profile) is deleted with its last endpoint.
+# A missing record or endpoint counts as removed.
+def delete_routed_dns_endpoint(dns_provider, hostname, cloud_provider, ip_address):
+    if dns_provider == "aws":
+        route53 = boto3.client('route53')
+        zone_id = os.getenv('AWS_HOSTED_ZONE_ID')
+        for record_set in _find_route53_record_sets(route53, zone_id, hostname):
+            if record_set.get('SetIdentifier') != cloud_provider:
+                continue
+            route53.change_resource_record_sets(HostedZoneId=zone_id, ChangeBatch={'Changes': [
+                {'Action': 'DELETE', 'ResourceRecordSet': record_set}]})
+            if record_set.get('HealthCheckId'):
+                route53.delete_health_check(HealthCheckId=record_set['HealthCheckId'])
+    elif dns_provider == "gcp":
+        session, url = _gcp_rrsets()
+        name = hostname if hostname.endswith('.') else f"{hostname}."
+        response = session.get(f"{url}/{name}/A")
+        if response.status_code == 404:
+            return
+        response.raise_for_status()
+        record_set = response.json()
+        policy = record_set.get("routingPolicy") or {}
+        routing = policy.get("wrr") or policy.get("geo") or {"items": []}
+        items = [item for item in routing["items"] if ip_address not in item.get("rrdatas", [])]
+        if len(items) == len(routing["items"]):
+            return
+        if items:
+            routing["items"] = items
+            response = session.patch(f"{url}/{name}/A", json=record_set)
+        else:
+            response = session.delete(f"{url}/{name}/A")
+        if response.status_code != 404:
+            response.raise_for_status()
+    elif dns_provider == "azure":
+        credential = DefaultAzureCredential()
+        subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
+        resource_group = os.getenv('AZURE_DNS_RESOURCE_GROUP')
+        profile_name = hostname.rstrip('.').replace('.', '-')
+        tm_client = TrafficManagerManagementClient(credential, subscription_id)
+        try:
+            tm_client.endpoints.delete(resource_group, profile_name, "ExternalEndpoints", cloud_provider)
+            profile = tm_client.profiles.get(resource_group, profile_name)
+        except Exception as e:
+            if getattr(e, 'status_code', None) == 404:
+                return
+            raise
+        if not profile.endpoints:
+            tm_client.profiles.delete(resource_group, profile_name)
+            zone_name = os.getenv('AZURE_DNS_ZONE_NAME')
+            DnsManagementClient(credential, subscription_id).record_sets.delete(
+                resource_group, zone_name, _azure_record_name(hostname, zone_name), 'CNAME')
+    else:
+        raise ValueError(f"Unsupported cloud provider: {dns_provider}")
+
+
+# Find the clouds where an app runs and the external IP of its ingress on each of them.
+# Clouds where the app is not deployed (or has no IP yet) are skipped.
+def get_app_endpoints(namespace, app_name, cloud_providers=SUPPORTED_CLOUDS):
+    endpoints = []
+    for provider in cloud_providers:
+        try:
+            networking_v1 = client.NetworkingV1Api(api_client=get_api_client(provider))
+            ingress = networking_v1.read_namespaced_ingress(name=app_name, namespace=namespace)
+            ingress_ip = ingress.status.load_balancer.ingress[0].ip
+        except Exception:
+            continue
+        if ingress_ip:
+            endpoints.append({"cloud_provider": provider, "ip": ingress_ip})
+    return endpoints
+
+
+# Publish one hostname backed by several endpoints (one per cloud where the app runs).
+#   endpoints:      [{"cloud_provider": "gcp", "ip": "1.2.3.4", "weight": 1, "region": "europe-west6"}, ...]
+#   routing_policy: "weighted" (traffic split by weight) or "latency" (closest endpoint by region).
+#                   The region of an endpoint is expressed in the vocabulary of the DNS provider.
+#   health_check:   optional {"path": "/", "port": 80, "interval": 30, "failure_threshold": 3},
+#                   for gcp the name of an existing health check is given as "gcp_health_check".
+def create_routed_dns_record(dns_provider, hostname, endpoints, routing_policy="weighted", ttl=DEFAULT_ROUTED_TTL, health_check=None):
+    if routing_policy not in ROUTING_POLICIES:
+        raise ValueError(f"Unsupported routing policy: {routing_policy}")
+    if not endpoints:
+        raise ValueError("No endpoint to route to")
+    if routing_policy == "latency" and any(not e.get("region") for e in endpoints):
+        raise ValueError("Latency routing requires a region for every endpoint")
+
+    if dns_provider == "aws":
+        return _create_aws_routed_record(hostname, endpoints, routing_policy, ttl, health_check)
+    elif dns_provider == "gcp":
+        return _create_gcp_routed_record(hostname, endpoints, routing_policy, ttl, health_check)
+    elif dns_provider == "azure":
+        return _create_azure_routed_record(hostname, endpoints, routing_policy, ttl, health_check)
+    else:
+        raise ValueError(f"Unsupported cloud provider: {dns_provider}")
+
+
+# Route53: one weighted or latency record set per endpoint, all upserted in a single change batch.
+def _create_aws_routed_record(hostname, endpoints, routing_policy, ttl, health_check):
+    route53 = boto3.client('route53')
+    changes = []
+    for endpoint in endpoints:
+        record_set = {
+            'Name': hostname,
+            'Type': 'A',
+            'SetIdentifier': endpoint['cloud_provider'],
+            'TTL': ttl,
+            'ResourceRecords': [{'Value': endpoint['ip']}],
+        }
+        if routing_policy == "weighted":
+            record_set['Weight'] = int(endpoint.get('weight', 1))
+        else:
+            record_set['Region'] = endpoint['region']
+
+        if health_check:
+            # The same CallerReference and settings return the existing health check.
+            # The FQDN is sent as Host header, so that the ingress routes the check to the app.
+            response = route53.create_health_check(
+                CallerReference=f"{hostname}-{endpoint['ip']}",
+                HealthCheckConfig={
+                    'IPAddress': endpoint['ip'],
+                    'FullyQualifiedDomainName': hostname.rstrip('.'),
+                    'Port': int(health_check.get('port', 80)),
+                    'Type': 'HTTP',
+                    'ResourcePath': health_check.get('path', '/'),
+                    'RequestInterval': int(health_check.get('interval', 30)),
+                    'FailureThreshold': int(health_check.get('failure_threshold', 3)),
+                }
+            )
+            record_set['HealthCheckId'] = response['HealthCheck']['Id']
+
+        changes.append({'Action': 'UPSERT', 'ResourceRecordSet': record_set})
+
+    return route53.change_resource_record_sets(
+        HostedZoneId=os.getenv('AWS_HOSTED_ZONE_ID'),
+        ChangeBatch={'Changes': changes}
+    )
+
+
+# Cloud DNS: a single record set with a weighted round robin or geolocation routing policy.
+def _create_gcp_routed_record(hostname, endpoints, routing_policy, ttl, health_check):
+    name = hostname if hostname.endswith('.') else f"{hostname}."
+    if routing_policy == "weighted":
+        items = [{"weight": float(e.get('weight', 1)), "rrdatas": [e['ip']]} for e in endpoints]
+        policy = {"wrr": {"items": items}}
+    else:
+        items = [{"location": e['region'], "rrdatas": [e['ip']]} for e in endpoints]
+        policy = {"geo": {"items": items}}
+    if health_check and health_check.get('gcp_health_check'):
+        policy["healthCheck"] = health_check['gcp_health_check']
+
+    return _upsert_gcp_record_set({"name": name, "type": "A", "ttl": ttl, "routingPolicy": policy})
+
+
+# Azure: a Traffic Manager profile (weighted or performance routing) with one external endpoint
+# per cloud, and a CNAME record in Azure DNS pointing the hostname to the profile.
+def _create_azure_routed_record(hostname, endpoints, routing_policy, ttl, health_check):
+    credential = DefaultAzureCredential()
+    subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
+    resource_group = os.getenv('AZURE_DNS_RESOURCE_GROUP')
+    profile_name = hostname.rstrip('.').replace('.', '-')
+
+    health_check = health_check or {}
+    profile = {
+        "location": "global",
+        "traffic_routing_method": "Weighted" if routing_policy == "weighted" else "Performance",
+        "dns_config": {"relative_name": profile_name, "ttl": ttl},
+        "monitor_config": {
+            "protocol": "HTTP",
+            "port": int(health_check.get('port', 80)),
+            "path": health_check.get('path', '/'),
+            "interval_in_seconds": int(health_check.get('interval', 30)),
+            "tolerated_number_of_failures": int(health_check.get('failure_threshold', 3)),
+            "custom_headers": [{"name": "Host", "value": hostname.rstrip('.')}],  # probes go to the IP, the ingress routes by host
+        },
+        "endpoints": [{
+            "name": e['cloud_provider'],
+            "type": "Microsoft.Network/trafficManagerProfiles/externalEndpoints",
+            "target": e['ip'],
+            "weight": int(e.get('weight', 1)),
+            "endpoint_location": e.get('region'),
+        } for e in endpoints],
+    }
+    tm_client = TrafficManagerManagementClient(credential, subscription_id)
+    tm_client.profiles.create_or_update(resource_group, profile_name, profile)
+
+    dns_client = DnsManagementClient(credential, subscription_id)
+    zone_name = os.getenv('AZURE_DNS_ZONE_NAME')
+    return dns_client.record_sets.create_or_update(
+        resource_group,
+        zone_name,
+        _azure_record_name(hostname, zone_name),
+        'CNAME',
+        {"ttl": ttl, "cname_record": {"cname": f"{profile_name}.trafficmanager.net"}}
+    )
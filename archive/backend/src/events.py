@@ -0,0 +1,123 @@
+#
+# In-process publish/subscribe of deployment events.
+#
+# Events are published on topics (a deployment id, a namespace). Each subscriber owns a bounded
+# queue, publishing only appends to those queues so fanning out to many subscribers is cheap.
+# The last events of every topic are kept so that late subscribers (or reconnecting clients
+# sending Last-Event-ID) get the events they missed.
+#
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+HISTORY_SIZE = int(os.getenv('EVENTS_HISTORY_SIZE', 50))  # events kept per topic
+MAX_TOPICS = int(os.getenv('EVENTS_MAX_TOPICS', 1000))  # topics with history kept
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv('EVENTS_SUBSCRIBER_QUEUE_SIZE', 100))
+
+# Event types of a deployment, in order
+DEPLOYMENT_CREATED = "deployment_created"
+SERVICE_CREATED = "service_created"
+INGRESS_CREATED = "ingress_created"
+IP_ASSIGNED = "ip_assigned"
+DNS_COMMITTED = "dns_committed"
+READY = "ready"
+FAILED = "failed"
+UNDEPLOYED = "undeployed"
+
+# Events ending the stream of a deployment
+TERMINAL_EVENTS = [READY, FAILED, UNDEPLOYED]
+
+
+class Subscription:
+    def __init__(self, broker, topics):
+        self.broker = broker
+        self.topics = topics
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    # Called by the broker. A slow subscriber loses its oldest events rather than blocking publishers.
+    def put(self, event):
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    # Next event, or None after timeout seconds
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    def __init__(self):
+        self._subscribers = {}  # topic -> set of subscriptions
+        self._history = OrderedDict()  # topic -> deque of events
+        self._listeners = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # Subscribe to one or more topics. Events after last_event_id still in the history are replayed.
+    def subscribe(self, *topics, last_event_id=None):
+        subscription = Subscription(self, topics)
+        with self._lock:
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+            if last_event_id is not None:
+                missed = [e for t in topics for e in self._history.get(t, ()) if e["id"] > last_event_id]
+                for event in sorted(missed, key=lambda e: e["id"]):
+                    subscription.put(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    # Register a callback called synchronously with every published event (e.g. cache invalidation)
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # Publish an event of the given type on several topics. Returns the event.
+    def publish(self, topics, event_type, **data):
+        with self._lock:
+            event = {"id": next(self._ids), "type": event_type, "time": time.time(), **data}
+            subscribers = set()
+            for topic in topics:
+                history = self._history.get(topic)
+                if history is None:
+                    history = self._history[topic] = deque(maxlen=HISTORY_SIZE)
+                    while len(self._history) > MAX_TOPICS:
+                        self._history.popitem(last=False)
+                history.append(event)
+                subscribers.update(self._subscribers.get(topic, ()))
+
+        for subscription in subscribers:
+            subscription.put(event)
+        for listener in self._listeners:
+            listener(event)
+        return event
+
+
+broker = EventBroker()
+
+
+# Format an event as a server-sent event
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,268 @@
+#
+# Durable deploy/undeploy jobs stored in the database and executed by worker processes (worker.py).
+#
+# Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED so that many workers can poll the same
+# table, followed by a conditional UPDATE so that the claim is also safe on databases without row
+# locks (SQLite). Each completed step is committed as a checkpoint: a job whose worker died (no
+# heartbeat for JOB_LEASE seconds) is claimed again and resumes after its last completed step.
+# Steps are idempotent: an already existing (deploy) or already deleted (undeploy) resource
+# counts as done. A failed step is retried with an exponential backoff (not_before).
+#
+# Workers are separate processes, so their progress cannot reach the in-process event broker of
+# the web backend directly: each web process runs a JobWatcher polling the job checkpoints and
+# publishing them as deployment events (which also invalidates the cached responses of the namespace).
+#
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from kubernetes.client.rest import ApiException
+from sqlalchemy import or_, and_, inspect
+from models import db, DeploymentJob
+from deploy_steps import (DeploymentError, create_deployment, create_service, create_ingress,
+                          get_ingress_ip, commit_dns_record, read_ingress_dns, delete_app_dns_records,
+                          delete_deployment, delete_service, delete_ingress, event_topics, INGRESS_IP_TIMEOUT)
+from events import (broker, DEPLOYMENT_CREATED, SERVICE_CREATED, INGRESS_CREATED, IP_ASSIGNED,
+                    DNS_COMMITTED, READY, FAILED, UNDEPLOYED)
+from utils import generate_public_url
+
+# Seconds without heartbeat after which a running job is considered abandoned by a dead worker
+JOB_LEASE = int(os.getenv('JOB_LEASE', 600))
+# Number of times a job is tried before being marked as failed
+MAX_JOB_ATTEMPTS = int(os.getenv('MAX_JOB_ATTEMPTS', 3))
+# Seconds before the first retry of a failed job, doubled after each attempt up to JOB_RETRY_MAX_DELAY
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', 30))
+JOB_RETRY_MAX_DELAY = int(os.getenv('JOB_RETRY_MAX_DELAY', 900))
+# Seconds between two polls of the job checkpoints by the JobWatcher of a web process, doubled
+# while the job table is missing (created by the first worker) or the database fails, up to JOB_WATCH_MAX_DELAY
+JOB_WATCH_INTERVAL = float(os.getenv('JOB_WATCH_INTERVAL', 1))
+JOB_WATCH_MAX_DELAY = 60
+# Jobs updated up to this many seconds before the last poll are read again (commit delays, clock skew)
+JOB_WATCH_OVERLAP = 10
+
+JOB_KINDS = ["deploy", "undeploy"]
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _host(params):
+    if "public_url" not in params:  # undeploy
+        return generate_public_url(params["cloud_provider"], params["domain"], params["namespace"], params["app_name"]).split("//")[1]
+    return params["public_url"].split("//")[1]
+
+
+# Steps of each kind of job: (name, function(params, result) returning a dict merged into the result, HTTP status meaning "already done")
+JOB_STEPS = {
+    "deploy": [
+        ("deployment", lambda p, r: create_deployment(p["cloud_provider"], p["namespace"], p["app_name"], p.get("collectable", False)), 409),
+        ("service", lambda p, r: create_service(p["cloud_provider"], p["namespace"], p["app_name"], p.get("collectable", False)), 409),
+        ("ingress", lambda p, r: create_ingress(p["cloud_provider"], p["namespace"], p["app_name"], _host(p), p.get("collectable", False)), 409),
+        ("ip", lambda p, r: {"ingress_ip": get_ingress_ip(p["cloud_provider"], p["namespace"], p["app_name"], INGRESS_IP_TIMEOUT)}, None),
+        ("dns", lambda p, r: commit_dns_record(p["cloud_provider"], _host(p), r["ingress_ip"]), None),
+    ],
+    "undeploy": [
+        # The ingress IP and global hostnames are read (and checkpointed) before the ingress is deleted:
+        # they identify the DNS records
+        ("ip", lambda p, r: read_ingress_dns(p["cloud_provider"], p["namespace"], p["app_name"]), 404),
+        ("dns", lambda p, r: delete_app_dns_records(p["cloud_provider"], _host(p), r.get("ingress_ip"), r.get("global_hosts")), None),
+        ("deployment", lambda p, r: delete_deployment(p["cloud_provider"], p["namespace"], p["app_name"]), 404),
+        ("service", lambda p, r: delete_service(p["cloud_provider"], p["namespace"], p["app_name"]), 404),
+        ("ingress", lambda p, r: delete_ingress(p["cloud_provider"], p["namespace"], p["app_name"]), 404),
+    ],
+}
+
+# Event published once a step of a deploy job is completed
+STEP_EVENTS = {
+    "deployment": DEPLOYMENT_CREATED,
+    "service": SERVICE_CREATED,
+    "ingress": INGRESS_CREATED,
+    "ip": IP_ASSIGNED,
+    "dns": DNS_COMMITTED,
+}
+
+
+def enqueue_job(kind, params, created_by=None):
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unsupported job kind: {kind}")
+    now = _now()
+    job = DeploymentJob(kind=kind, params=params, status='pending', completed_steps=[], attempts=0,
+                        created_by=created_by, created_at=now, updated_at=now)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def job_to_dict(job):
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": job.params,
+        "completed_steps": job.completed_steps,
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "not_before": job.not_before.isoformat() if job.not_before else None,
+        "created_by": job.created_by,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+
+# Claim the oldest pending (and due) or abandoned job for the given worker. Returns None when there is none.
+def claim_job(worker_id):
+    now = _now()
+    claimable = or_(
+        and_(DeploymentJob.status == 'pending', or_(DeploymentJob.not_before.is_(None), DeploymentJob.not_before <= now)),
+        and_(DeploymentJob.status == 'running', DeploymentJob.heartbeat_at < now - timedelta(seconds=JOB_LEASE)),
+    )
+    job = (DeploymentJob.query.filter(claimable)
+           .order_by(DeploymentJob.id)
+           .with_for_update(skip_locked=True)
+           .first())
+    if job is None:
+        db.session.rollback()
+        return None
+
+    claimed = (DeploymentJob.query.filter(DeploymentJob.id == job.id, claimable)
+               .update({"status": 'running', "worker_id": worker_id, "heartbeat_at": now, "updated_at": now,
+                        "attempts": DeploymentJob.attempts + 1}, synchronize_session=False))
+    db.session.commit()
+    if not claimed:
+        return None
+    return db.session.get(DeploymentJob, job.id)
+
+
+def _finish(job, status, error=None):
+    job.status = status
+    job.error = error
+    job.updated_at = _now()
+    db.session.commit()
+
+
+# Run the remaining steps of a claimed job, committing a checkpoint after each of them.
+# A failed step is retried later (from the checkpoint, after a backoff) until MAX_JOB_ATTEMPTS is reached.
+def run_job(job, worker_id):
+    if job.attempts > MAX_JOB_ATTEMPTS:
+        _finish(job, 'failed', job.error or "Too many attempts")
+        return job
+
+    for name, step, done_status in JOB_STEPS[job.kind]:
+        if name in job.completed_steps:
+            continue
+
+        # Stop if the job was reclaimed by another worker (e.g. this one was stalled past the lease)
+        db.session.refresh(job)
+        if job.worker_id != worker_id or job.status != 'running':
+            return job
+
+        try:
+            output = step(job.params, job.result or {})
+        except DeploymentError as e:
+            cause = e.__cause__
+            if not (done_status and isinstance(cause, ApiException) and cause.status == done_status):
+                if job.attempts < MAX_JOB_ATTEMPTS:
+                    delay = min(JOB_RETRY_DELAY * 2 ** (job.attempts - 1), JOB_RETRY_MAX_DELAY)
+                    job.not_before = _now() + timedelta(seconds=delay)
+                    _finish(job, 'pending', str(e))
+                else:
+                    _finish(job, 'failed', str(e))
+                return job
+            output = None
+
+        job.completed_steps = job.completed_steps + [name]
+        if output:
+            job.result = {**(job.result or {}), **output}
+        job.heartbeat_at = job.updated_at = _now()
+        db.session.commit()
+
+    _finish(job, 'succeeded')
+    return job
+
+
+class JobWatcher:
+    def __init__(self):
+        self._published = {}  # job id -> (completed steps published, status published, updated_at)
+        self._since = None
+        self._thread = None
+        self._delay = JOB_WATCH_INTERVAL
+        self._problem = None  # why the last poll did not happen, logged once
+
+    # Start polling the jobs updated from now on, in a background thread
+    def init_app(self, app):
+        self._since = _now()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(app,), name="job-watcher", daemon=True)
+            self._thread.start()
+
+    def _run(self, app):
+        while True:
+            time.sleep(self.tick(app))
+
+    # Poll once the job table exists. Returns the number of seconds to wait before the next tick.
+    def tick(self, app):
+        try:
+            with app.app_context():
+                if not inspect(db.engine).has_table(DeploymentJob.__tablename__):
+                    return self._backoff("waiting for the deployment_job table to be created (by a worker)")
+                self.poll()
+        except Exception as e:
+            return self._backoff(f"failed to poll jobs: {str(e).splitlines()[0]}")
+        if self._problem:
+            print("Job watcher: polling jobs again")
+        self._delay, self._problem = JOB_WATCH_INTERVAL, None
+        return self._delay
+
+    def _backoff(self, problem):
+        if problem != self._problem:
+            print(f"Job watcher: {problem}")
+            self._problem = problem
+        self._delay = min(self._delay * 2, JOB_WATCH_MAX_DELAY)
+        return self._delay
+
+    # Publish the steps completed and the jobs finished since the last poll
+    def poll(self):
+        now = _now()
+        query = DeploymentJob.query
+        if self._since:
+            query = query.filter(DeploymentJob.updated_at >= self._since - timedelta(seconds=JOB_WATCH_OVERLAP))
+        jobs = query.order_by(DeploymentJob.updated_at).all()
+        db.session.rollback()  # do not keep a transaction open between polls
+
+        for job in jobs:
+            self._publish(job)
+        self._since = now
+
+        # Jobs finished before the overlap window are not read again
+        cutoff = (now - timedelta(seconds=2 * JOB_WATCH_OVERLAP)).replace(tzinfo=None)
+        for job_id, (_, status, updated_at) in list(self._published.items()):
+            if status in ('succeeded', 'failed') and updated_at.replace(tzinfo=None) < cutoff:
+                del self._published[job_id]
+
+    def _publish(self, job):
+        steps_published, status_published, _ = self._published.get(job.id, (0, None, None))
+        params, result = job.params, job.result or {}
+        deployment_id = params.get("deployment_id") or f"job-{job.id}"
+        topics = event_topics(deployment_id, params["namespace"])
+        info = {"deployment_id": deployment_id, "job_id": job.id, "cloud_provider": params["cloud_provider"],
+                "namespace": params["namespace"], "app_name": params["app_name"]}
+
+        if job.kind == "deploy":
+            for name in job.completed_steps[steps_published:]:
+                data = {"ingress_ip": result.get("ingress_ip")} if name == "ip" else {"host": _host(params)} if name == "dns" else {}
+                broker.publish(topics, STEP_EVENTS[name], **data, **info)
+
+        if job.status != status_published:
+            if job.status == 'succeeded' and job.kind == "deploy":
+                broker.publish(topics, READY, public_url=params["public_url"], **info)
+            elif job.status == 'succeeded':
+                broker.publish(topics, UNDEPLOYED, **info)
+            elif job.status == 'failed':
+                broker.publish(topics, FAILED, error=job.error, **info)
+
+        self._published[job.id] = (len(job.completed_steps), job.status, job.updated_at)
+
+
+job_watcher = JobWatcher()
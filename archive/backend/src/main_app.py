@@ -1,15 +1,18 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager
 from config import Config
-from auth import auth_bp
+from models import db
+from auth import auth_bp, init_token_auth
 from deployment import deployment_bp
+from audit import audit_log
+from jobs import job_watcher
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
-db = SQLAlchemy(app)
-jwt = JWTManager(app)
+db.init_app(app)
+init_token_auth(app)
+audit_log.init_app(app)
+job_watcher.init_app(app)
 
 # organize the application into modular components.
 app.register_blueprint(auth_bp, url_prefix='/auth')
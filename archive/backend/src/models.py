@@ -17,4 +17,39 @@ class Deployment(db.Model):
 class TokenBlocklist(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False)
-    created_at = db.Column(db.DateTime, nullable=False)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, nullable=False)
+
+# Durable deploy/undeploy job executed by a worker process (see jobs.py and worker.py).
+# completed_steps is the checkpoint: a restarted worker resumes after the last completed step.
+class DeploymentJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # deploy or undeploy
+    params = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, running, succeeded or failed
+    completed_steps = db.Column(db.JSON, nullable=False, default=list)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker_id = db.Column(db.String(80))
+    heartbeat_at = db.Column(db.DateTime)
+    not_before = db.Column(db.DateTime)  # a failed job is not retried before (backoff)
+    created_by = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+# Audit trail of the operations on deployments (see audit.py), written in batches
+class AuditEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    username = db.Column(db.String(80))
+    action = db.Column(db.String(40), nullable=False)
+    app_name = db.Column(db.String(80))
+    namespace = db.Column(db.String(80))
+    cloud_provider = db.Column(db.String(20))
+    status = db.Column(db.Integer)
+    details = db.Column(db.JSON)
+
+    __table_args__ = (
+        db.Index('ix_audit_event_username_created_at', 'username', 'created_at'),
+        db.Index('ix_audit_event_app_name_created_at', 'app_name', 'created_at'),
+    )
@@ -0,0 +1,167 @@
+#
+# Latency-aware placement of apps on the supported clouds.
+#
+# Every deploy step against a cluster is recorded here (latency + success/failure).
+# When a deploy request does not name a cloud provider, the clouds are scored on
+# their recent step latencies, API error rates and allocatable capacity and the
+# app is placed on the best one. Recent means the last WINDOW_SIZE steps of the
+# last WINDOW_SECONDS: older steps no longer describe the cloud.
+#
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from utils import SUPPORTED_CLOUDS, get_api_client
+
+# Number of recent deploy steps kept per cloud, and their maximum age in seconds
+WINDOW_SIZE = int(os.getenv('PLACEMENT_WINDOW_SIZE', 50))
+WINDOW_SECONDS = int(os.getenv('PLACEMENT_WINDOW_SECONDS', 900))
+# Number of seconds a capacity probe of a cluster is reused
+CAPACITY_TTL = int(os.getenv('PLACEMENT_CAPACITY_TTL', 30))
+# Number of seconds a capacity probe may take, and a placement decision may wait for the first probes
+CAPACITY_TIMEOUT = float(os.getenv('PLACEMENT_CAPACITY_TIMEOUT', 2))
+
+# Weights of the score components (lower score is better)
+LATENCY_WEIGHT = float(os.getenv('PLACEMENT_LATENCY_WEIGHT', 0.4))
+ERROR_WEIGHT = float(os.getenv('PLACEMENT_ERROR_WEIGHT', 0.4))
+CAPACITY_WEIGHT = float(os.getenv('PLACEMENT_CAPACITY_WEIGHT', 0.2))
+
+
+_samples = {provider: deque(maxlen=WINDOW_SIZE) for provider in SUPPORTED_CLOUDS}  # (time, latency, ok)
+_capacity = {}  # provider -> (probe time, capacity dict or None)
+_refreshing = {}  # provider -> event set when its running probe finishes
+_lock = threading.Lock()
+
+
+# Record the outcome of one API call against the cluster of a cloud provider.
+def record_step(cloud_provider, latency, ok):
+    with _lock:
+        _samples[cloud_provider].append((time.monotonic(), latency, ok))
+
+
+# Time the enclosed block and record it as a deploy step of the given cloud provider.
+# Server errors (5xx) and transport failures are recorded as errors and re-raised; client
+# errors such as 409 Conflict are re-raised but count as a successful call of the cloud API.
+@contextmanager
+def track(cloud_provider):
+    start = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    except ApiException as e:
+        ok = e.status is not None and 400 <= e.status < 500
+        raise
+    finally:
+        record_step(cloud_provider, time.monotonic() - start, ok)
+
+
+# Read the allocatable capacity of a cluster from its nodes.
+# Returns the allocatable and used pod slots, or None when the cluster cannot be reached.
+def _probe_capacity(cloud_provider):
+    try:
+        core_v1 = client.CoreV1Api(api_client=get_api_client(cloud_provider))
+        allocatable = 0
+        for node in core_v1.list_node(_request_timeout=CAPACITY_TIMEOUT).items:
+            if node.spec.unschedulable:
+                continue
+            allocatable += int(node.status.allocatable.get("pods", 0))
+        used = len(core_v1.list_pod_for_all_namespaces(
+            field_selector="status.phase!=Succeeded,status.phase!=Failed",
+            _request_timeout=CAPACITY_TIMEOUT,
+        ).items)
+        return {"allocatable_pods": allocatable, "used_pods": used}
+    except Exception:
+        return None
+
+
+def _refresh_capacity(cloud_provider):
+    capacity = _probe_capacity(cloud_provider)
+    with _lock:
+        _capacity[cloud_provider] = (time.monotonic(), capacity)
+        _refreshing.pop(cloud_provider).set()
+
+
+# Probe the capacity of a cluster in a background thread once CAPACITY_TTL expired.
+# Returns the cached capacity (possibly stale, None if never probed) and the event of the running probe.
+def refresh_capacity(cloud_provider):
+    with _lock:
+        cached = _capacity.get(cloud_provider)
+        done = _refreshing.get(cloud_provider)
+        if done is None and not (cached and time.monotonic() - cached[0] < CAPACITY_TTL):
+            done = _refreshing[cloud_provider] = threading.Event()
+            threading.Thread(target=_refresh_capacity, args=(cloud_provider,), daemon=True).start()
+    return cached, done
+
+
+# Return the capacity of a cluster without blocking on it: a stale value is returned while it is
+# refreshed in the background. Only a cluster never probed is waited for, up to timeout seconds.
+def get_capacity(cloud_provider, timeout=CAPACITY_TIMEOUT):
+    cached, done = refresh_capacity(cloud_provider)
+    if cached or done is None:
+        return cached[1] if cached else None
+    done.wait(timeout)
+    with _lock:
+        cached = _capacity.get(cloud_provider)
+    return cached[1] if cached else None
+
+
+# Snapshot of the rolling statistics of a cloud provider. Samples older than WINDOW_SECONDS are dropped.
+def get_stats(cloud_provider):
+    cutoff = time.monotonic() - WINDOW_SECONDS
+    with _lock:
+        window = _samples[cloud_provider]
+        while window and window[0][0] < cutoff:
+            window.popleft()
+        samples = list(window)
+    if not samples:
+        return {"samples": 0, "avg_latency": None, "error_rate": None}
+    latencies = [latency for _, latency, _ in samples]
+    errors = sum(1 for _, _, ok in samples if not ok)
+    return {
+        "samples": len(samples),
+        "avg_latency": round(sum(latencies) / len(latencies), 4),
+        "error_rate": round(errors / len(samples), 4),
+    }
+
+
+# Score every supported cloud and return the best one together with the inputs of the decision.
+# Clouds without samples get a neutral latency/error score so that they are still tried.
+# Unreachable clusters (or clusters still being probed for the first time) are only chosen
+# if no cloud can be reached at all.
+def choose_cloud_provider():
+    # Start the probes of every cloud at once, so that waiting is bounded by one CAPACITY_TIMEOUT
+    for provider in SUPPORTED_CLOUDS:
+        refresh_capacity(provider)
+    deadline = time.monotonic() + CAPACITY_TIMEOUT
+
+    inputs = {}
+    for provider in SUPPORTED_CLOUDS:
+        inputs[provider] = get_stats(provider)
+        inputs[provider]["capacity"] = get_capacity(provider, timeout=max(0, deadline - time.monotonic()))
+
+    max_latency = max((s["avg_latency"] for s in inputs.values() if s["avg_latency"]), default=0)
+
+    for provider, stats in inputs.items():
+        if stats["avg_latency"] is None:
+            latency_score, error_score = 0.5, 0.5
+        else:
+            latency_score = stats["avg_latency"] / max_latency if max_latency else 0
+            error_score = stats["error_rate"]
+
+        capacity = stats["capacity"]
+        if capacity and capacity["allocatable_pods"]:
+            used_ratio = min(capacity["used_pods"] / capacity["allocatable_pods"], 1)
+        else:
+            used_ratio = 1  # unknown or saturated
+
+        stats["score"] = round(
+            LATENCY_WEIGHT * latency_score + ERROR_WEIGHT * error_score + CAPACITY_WEIGHT * used_ratio, 4
+        )
+
+    reachable = [p for p in SUPPORTED_CLOUDS if inputs[p]["capacity"] is not None] or SUPPORTED_CLOUDS
+    chosen = min(reachable, key=lambda p: inputs[p]["score"])
+    return chosen, {"mode": "auto", "cloud_provider": chosen, "inputs": inputs}
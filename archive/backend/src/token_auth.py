@@ -0,0 +1,191 @@
+#
+# Fast verification of the access tokens issued by the platform.
+#
+# Tokens are signed either with the shared secret (HS256) or with an asymmetric key (RS256/ES256).
+# Public keys come from a JWKS file or endpoint, cached and refreshed so that keys can be rotated:
+# publish the new public key, replace the private key file (the backend picks it up with its kid,
+# see auth.load_private_key), remove the old public key once its tokens expired. The kid of a key
+# is its RFC 7638 thumbprint (jwk_thumbprint), unless another one is given in a file next to it.
+# Other services verify tokens with the JWKS only, without the shared secret.
+#
+# Verified claims are cached per token until the token expires, so that a request carrying a
+# known token costs a dictionary lookup instead of a signature verification. The blocklist
+# (logout) is re-checked at most every BLOCKLIST_RECHECK seconds per token.
+#
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from functools import wraps
+from flask import request, jsonify, g, current_app
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from jwt import PyJWK, decode, get_unverified_header, InvalidTokenError
+from jwt.algorithms import ECAlgorithm, RSAAlgorithm
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
+JWKS_TTL = int(os.getenv('JWT_JWKS_TTL', 300))  # seconds between two reloads of the key set
+JWKS_MIN_REFRESH = 10  # seconds between two reloads triggered by an unknown kid
+CLAIMS_CACHE_SIZE = int(os.getenv('JWT_CLAIMS_CACHE_SIZE', 10000))
+BLOCKLIST_RECHECK = int(os.getenv('JWT_BLOCKLIST_RECHECK', 30))
+
+
+# Public JWK of a PEM private key (RSA or EC)
+def public_jwk(private_key_pem):
+    public_key = load_pem_private_key(private_key_pem.encode(), password=None).public_key()
+    algorithm = ECAlgorithm if isinstance(public_key, ec.EllipticCurvePublicKey) else RSAAlgorithm
+    return algorithm.to_jwk(public_key, as_dict=True)
+
+
+# RFC 7638 thumbprint of a public JWK: the SHA-256 of its required members, used as its kid
+def jwk_thumbprint(jwk):
+    members = ("crv", "kty", "x", "y") if jwk["kty"] == "EC" else ("e", "kty", "n")
+    canonical = json.dumps({member: jwk[member] for member in members}, separators=(",", ":"), sort_keys=True)
+    return base64.urlsafe_b64encode(hashlib.sha256(canonical.encode()).digest()).rstrip(b"=").decode()
+
+
+class KeySet:
+    # Public keys by kid, loaded from a JWKS file or URL
+    def __init__(self, jwks_file=None, jwks_url=None, ttl=JWKS_TTL):
+        if not jwks_file and not jwks_url:
+            raise ValueError("A JWKS file or URL is required")
+        self.jwks_file = jwks_file
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self._jwks = {"keys": []}
+        self._keys = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        if self.jwks_file:
+            with open(self.jwks_file) as f:
+                return json.load(f)
+        with urllib.request.urlopen(self.jwks_url, timeout=5) as response:
+            return json.load(response)
+
+    def refresh(self):
+        jwks = self._fetch()
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            keys[jwk.get("kid")] = PyJWK(jwk).key
+        with self._lock:
+            self._jwks, self._keys, self._loaded_at = jwks, keys, time.monotonic()
+
+    # Public key of the given kid. The key set is reloaded when stale or when the kid is unknown.
+    def get(self, kid):
+        age = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+        if age is None or age > self.ttl or (kid not in self._keys and age > JWKS_MIN_REFRESH):
+            self.refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            raise InvalidTokenError(f"Unknown key id: {kid}")
+        return key
+
+    # The public JWKS, e.g. to serve it to other services
+    def to_jwks(self):
+        if self._loaded_at is None:
+            self.refresh()
+        return self._jwks
+
+
+class TokenVerifier:
+    # algorithm: HS256 (with secret) or RS256/ES256 (with key_set)
+    # is_revoked: optional callback(jti) telling whether a token was revoked
+    def __init__(self, algorithm="HS256", secret=None, key_set=None, is_revoked=None, cache_size=CLAIMS_CACHE_SIZE):
+        if algorithm in ASYMMETRIC_ALGORITHMS and key_set is None:
+            raise ValueError(f"{algorithm} requires a key set")
+        if algorithm not in ASYMMETRIC_ALGORITHMS and not secret:
+            raise ValueError(f"{algorithm} requires a secret")
+        self.algorithm = algorithm
+        self.secret = secret
+        self.key_set = key_set
+        self.is_revoked = is_revoked
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # token digest -> [claims, expires at, blocklist checked at]
+        self._revoked = {}  # jti -> expiry of the revoked token
+        self._lock = threading.Lock()
+
+    def _decode(self, token):
+        if self.algorithm in ASYMMETRIC_ALGORITHMS:
+            key = self.key_set.get(get_unverified_header(token).get("kid"))
+        else:
+            key = self.secret
+        # The platform identity (sub) is a dict, not a string
+        return decode(token, key, algorithms=[self.algorithm], options={"verify_sub": False})
+
+    # Return the claims of a valid access token, raise InvalidTokenError otherwise
+    def verify(self, token):
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry is not None:
+                self._cache.move_to_end(digest)
+
+        if entry is None or entry[1] <= now:
+            claims = self._decode(token)
+            if claims.get("type", "access") != "access":
+                raise InvalidTokenError("Not an access token")
+            entry = [claims, claims.get("exp", now + JWKS_TTL), 0]
+
+        claims = entry[0]
+        if claims.get("jti") in self._revoked:
+            raise InvalidTokenError("Token has been revoked")
+        if self.is_revoked and now - entry[2] > BLOCKLIST_RECHECK:
+            if self.is_revoked(claims.get("jti")):
+                self.revoke(claims.get("jti"), entry[1])
+                raise InvalidTokenError("Token has been revoked")
+            entry[2] = now
+
+        with self._lock:
+            self._cache[digest] = entry
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return claims
+
+    # Revoke a token immediately in this process (e.g. on logout)
+    def revoke(self, jti, expires_at=None):
+        now = time.time()
+        with self._lock:
+            self._revoked = {j: exp for j, exp in self._revoked.items() if exp > now}
+            self._revoked[jti] = expires_at or now + JWKS_TTL
+
+
+# Verifier of the application, created by auth.init_token_auth()
+def get_verifier():
+    return current_app.extensions["token_verifier"]
+
+
+# Decorator protecting an endpoint with an access token whose identity has one of the given roles.
+# Replaces @jwt_required() followed by a role check on get_jwt_identity().
+def role_required(*roles):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            header = request.headers.get("Authorization", "")
+            if not header.startswith("Bearer "):
+                return jsonify({"msg": "Missing Authorization Header"}), 401
+            try:
+                claims = get_verifier().verify(header[len("Bearer "):])
+            except InvalidTokenError as e:
+                return jsonify({"msg": str(e)}), 401
+
+            identity = claims.get("sub") or {}
+            if roles and identity.get("role") not in roles:
+                return jsonify({"error": "Unauthorized"}), 403
+
+            g.jwt_claims = claims
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Identity ({"username", "role"}) of the token verified by role_required
+def current_identity():
+    return g.jwt_claims["sub"]
@@ -0,0 +1,33 @@
+import re
+import threading
+from kubernetes import config
+
+# Clouds supported by the platform. Each one is a context in the kube config.
+SUPPORTED_CLOUDS = ["aws", "gcp", "azure"]
+
+# Validate domain using regex
+def validate_domain(domain):
+    domain_regex = re.compile(
+        r"^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,}$", re.IGNORECASE
+    )
+    return bool(domain_regex.match(domain))
+
+# Generate a public URL
+# app_name must be unique ==> genenerated URL is unique for each deployment
+def generate_public_url(cloud_provider, domain, namespace, app_name):
+    return f"http://{namespace}.{app_name}.{cloud_provider}.{domain}"
+
+
+_api_clients = {}
+_api_clients_lock = threading.Lock()
+
+# Return a Kubernetes API client bound to the context of the given cloud provider.
+# Unlike config.load_kube_config() it does not touch the global default configuration,
+# so it is safe to talk to several clusters from the same process. Clients are reused.
+def get_api_client(cloud_provider):
+    with _api_clients_lock:
+        api_client = _api_clients.get(cloud_provider)
+        if api_client is None:
+            api_client = config.new_client_from_config(context=cloud_provider)
+            _api_clients[cloud_provider] = api_client
+        return api_client
@@ -0,0 +1,76 @@
+#
+# Worker process executing the deploy/undeploy jobs queued in the database (see jobs.py).
+# Workers are scaled independently of the web backend:
+#
+#   python worker.py              # poll for jobs forever
+#   python worker.py --once       # run the pending jobs and exit
+#
+# SQLALCHEMY_DATABASE_URI is read from the environment (e.g. sqlite:///jobs.db to run offline),
+# falling back to the secret used by the backend.
+#
+import argparse
+import os
+import signal
+import socket
+import time
+from flask import Flask
+from models import db
+from jobs import claim_job, run_job
+
+# Seconds between two polls of the job table when it is empty
+POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', 2))
+
+
+def create_worker_app():
+    app = Flask(__name__)
+    database_uri = os.getenv('SQLALCHEMY_DATABASE_URI')
+    if not database_uri:
+        from config import Config
+        database_uri = Config.SQLALCHEMY_DATABASE_URI
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    db.init_app(app)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Execute queued deploy/undeploy jobs")
+    parser.add_argument("--once", action="store_true", help="exit when no job is pending")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    args = parser.parse_args()
+
+    # Finish the current job on SIGTERM/SIGINT, then exit
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+    app = create_worker_app()
+    with app.app_context():
+        db.create_all()
+        print(f"Worker {args.worker_id} started")
+        while not stopping:
+            try:
+                job = claim_job(args.worker_id)
+            except Exception as e:
+                print(f"Failed to claim a job: {e}")
+                db.session.rollback()
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            if job is None:
+                if args.once:
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            print(f"Running {job.kind} job {job.id} (attempt {job.attempts}, completed steps: {job.completed_steps})")
+            try:
+                run_job(job, args.worker_id)
+                print(f"Job {job.id}: {job.status}")
+            except Exception as e:
+                # The job stays running and is claimed again once its lease expired
+                print(f"Job {job.id} interrupted: {e}")
+                db.session.rollback()
+
+
+if __name__ == "__main__":
+    main()
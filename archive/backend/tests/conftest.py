@@ -0,0 +1,52 @@
+#
+# The tests run offline: every cloud dependency is replaced by the fakes of the load tests
+# (bench/fakes.py) and the database is an in-memory SQLite database.
+#
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bench"))
+
+import fakes
+
+fakes.LATENCY.update({"k8s": 0, "dns": 0, "secrets": 0})
+fakes.install("sqlite://", jwt_secret="test-secret-test-secret-test-secret")
+
+import pytest
+from flask import Flask
+from models import db
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+# Client of the deployment API, authenticated as an admin
+@pytest.fixture
+def api(app):
+    from flask_jwt_extended import create_access_token
+    from auth import init_token_auth
+    from deployment import deployment_bp
+    app.config['JWT_SECRET_KEY'] = "test-secret-test-secret-test-secret"
+    init_token_auth(app)
+    app.register_blueprint(deployment_bp, url_prefix='/deployment')
+    token = create_access_token(identity={"username": "admin", "role": "admin"})
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f"Bearer {token}"
+    return client
+
+
+@pytest.fixture(autouse=True)
+def clusters():
+    fakes.CLUSTERS.clear()
+    yield fakes.CLUSTERS
@@ -0,0 +1,57 @@
+import multiprocessing
+from datetime import datetime, timedelta, timezone
+from audit import AuditLog, JsonlSink
+
+
+def make_log(directory):
+    log = AuditLog()
+    log.sink = JsonlSink(str(directory))
+    return log
+
+
+def write_events(directory, worker):
+    log = make_log(directory)
+    for i in range(200):
+        log.record("deploy", username=f"worker-{worker}", app_name=f"app-{i}", padding="x" * 2000)
+        if i % 20 == 0:
+            log.flush()
+    log.flush()
+
+
+def test_jsonl_sink_shared_by_several_processes(tmp_path):
+    processes = [multiprocessing.Process(target=write_events, args=(tmp_path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    log = make_log(tmp_path)
+    assert len(log.query(limit=10000)) == 800
+    assert len(log.query(username="worker-2", limit=10000)) == 200
+
+
+def test_query_time_range_in_any_time_zone(tmp_path):
+    log = make_log(tmp_path)
+    log.record("deploy", username="alice", app_name="web")
+    log.flush()
+    created_at = datetime.fromisoformat(log.query()[0]["created_at"])
+
+    # the same instant expressed in UTC+02:00
+    local = created_at.astimezone(timezone(timedelta(hours=2)))
+    assert len(log.query(since=local - timedelta(seconds=1), until=local + timedelta(seconds=1))) == 1
+    assert len(log.query(since=local + timedelta(seconds=1))) == 0
+    assert len(log.query(until=local - timedelta(seconds=1))) == 0
+
+
+def test_failed_write_is_retried_at_the_next_flush(tmp_path, monkeypatch):
+    log = make_log(tmp_path)
+    write = log.sink.write
+
+    def fail_once(events):
+        monkeypatch.setattr(log.sink, "write", write)
+        raise OSError("No space left on device")
+    monkeypatch.setattr(log.sink, "write", fail_once)
+
+    log.record("deploy", username="alice", app_name="web")
+    log.flush()
+    assert log.query()[0]["app_name"] == "web"
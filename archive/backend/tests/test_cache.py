@@ -0,0 +1,56 @@
+import pytest
+from flask import Flask, jsonify, request
+from cache import ResponseCache, cached_response, response_cache
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    state = {"version": 1, "invalidate_during_render": False}
+
+    @app.route('/status')
+    @cached_response
+    def status():
+        body = jsonify({"version": state["version"]})
+        if state["invalidate_during_render"]:
+            # a deploy event published while the view has already read the cluster
+            state["invalidate_during_render"] = False
+            state["version"] += 1
+            response_cache.invalidate(request.args.get('namespace', 'default'))
+        return body
+
+    response_cache.clear()
+    client = app.test_client()
+    client.state = state
+    return client
+
+
+def test_etag_revalidation(client):
+    first = client.get('/status?namespace=tenant-a')
+    assert first.status_code == 200 and first.headers['ETag']
+
+    revalidated = client.get('/status?namespace=tenant-a', headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304 and revalidated.data == b""
+
+
+def test_invalidation_drops_the_tenant_responses(client):
+    client.get('/status?namespace=tenant-a')
+    client.state["version"] = 2
+    assert client.get('/status?namespace=tenant-a').json == {"version": 1}  # cached
+
+    response_cache.invalidate('tenant-a')
+    assert client.get('/status?namespace=tenant-a').json == {"version": 2}
+
+
+def test_response_rendered_during_an_invalidation_is_not_stored(client):
+    client.state["invalidate_during_render"] = True
+    assert client.get('/status?namespace=tenant-a').json == {"version": 1}
+    assert client.get('/status?namespace=tenant-a').json == {"version": 2}
+
+
+def test_stale_generation_is_not_stored():
+    cache = ResponseCache()
+    generation = cache.generation('tenant-a')
+    cache.invalidate('tenant-a')
+    cache.set('tenant-a', 'key', b"{}", generation)
+    assert cache.get('tenant-a', 'key') is None
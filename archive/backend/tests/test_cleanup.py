@@ -0,0 +1,131 @@
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+import cleanup
+import deploy_steps
+import dns_manager
+from deploy_steps import (create_deployment, create_service, create_ingress, add_ingress_host,
+                          LAST_ACTIVITY_ANNOTATION)
+from cleanup import collect, IDLE_SINCE_ANNOTATION
+
+
+def deploy(app_name, idle_days=0, idle_since_days=None, cloud_provider="gcp", namespace="tenant-a", collectable=True):
+    create_deployment(cloud_provider, namespace, app_name, collectable)
+    create_service(cloud_provider, namespace, app_name, collectable)
+    create_ingress(cloud_provider, namespace, app_name, f"{namespace}.{app_name}.{cloud_provider}.example.com", collectable)
+    deployment = cleanup.client.AppsV1Api(api_client=cloud_provider).read_namespaced_deployment(app_name, namespace)
+    now = datetime.now(timezone.utc)
+    deployment.metadata.annotations[LAST_ACTIVITY_ANNOTATION] = (now - timedelta(days=idle_days)).isoformat()
+    if idle_since_days is not None:
+        deployment.metadata.annotations[IDLE_SINCE_ANNOTATION] = (now - timedelta(days=idle_since_days)).isoformat()
+
+
+def apps(clusters, cloud_provider="gcp"):
+    return sorted(name for kind, _, name in clusters[cloud_provider].objects if kind == "deployment")
+
+
+@pytest.fixture
+def dns(monkeypatch):
+    calls = {"records": [], "routed": []}
+    monkeypatch.setattr(cleanup, "delete_dns_records", lambda provider, records: calls["records"].extend(records))
+    monkeypatch.setattr(deploy_steps, "delete_routed_dns_endpoint", lambda *args: calls["routed"].append(args))
+    return calls
+
+
+def test_idle_apps_are_marked_then_deleted(clusters, dns):
+    deploy("active", idle_days=1)
+    deploy("idle", idle_days=8)
+    deploy("expired", idle_days=9, idle_since_days=2)
+
+    report = collect("gcp", ttl_hours=7 * 24, grace_hours=24)
+    assert report["marked"] == ["tenant-a/idle"]
+    assert report["deleted"] == ["tenant-a/expired"]
+    assert apps(clusters) == ["active", "idle"]
+    assert [host for host, _ in dns["records"]] == ["tenant-a.expired.gcp.example.com"]
+
+
+def test_apps_not_opted_in_are_never_collected(clusters, dns):
+    deploy("served", idle_days=30, idle_since_days=10, collectable=False)
+
+    report = collect("gcp", ttl_hours=7 * 24, grace_hours=24)
+    assert report == {"cloud_provider": "gcp", "marked": [], "unmarked": [], "deleted": [], "active": 0}
+    assert apps(clusters) == ["served"]
+    assert dns["records"] == []
+
+
+def test_accessed_app_is_unmarked_and_kept(clusters, dns):
+    deploy("polled", idle_days=9, idle_since_days=2)
+
+    cleanup._refresh_activity("gcp", "tenant-a", "polled")  # what touch_app runs in the background
+    report = collect("gcp", ttl_hours=7 * 24, grace_hours=24)
+    assert report["unmarked"] == ["tenant-a/polled"]
+    assert report["deleted"] == []
+    assert apps(clusters) == ["polled"]
+
+
+def test_touch_app_is_throttled(monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(cleanup, "_refresh_activity", lambda *key: refreshed.append(key))
+    monkeypatch.setattr(cleanup.threading, "Thread", lambda target, args, daemon: type("T", (), {"start": lambda self: target(*args)})())
+    cleanup._touched.clear()
+    for _ in range(3):
+        cleanup.touch_app("gcp", "tenant-a", "web")
+    assert refreshed == [("gcp", "tenant-a", "web")]
+
+
+def test_global_hostnames_lose_the_endpoint_of_the_cloud(clusters, dns):
+    deploy("web", idle_days=9, idle_since_days=2)
+    add_ingress_host("gcp", "tenant-a", "web", "tenant-a.web.example.com", "aws")
+
+    collect("gcp", ttl_hours=7 * 24, grace_hours=24)
+    ingress_ip = dns["records"][0][1]
+    assert dns["records"] == [("tenant-a.web.gcp.example.com", ingress_ip)]
+    assert dns["routed"] == [("aws", "tenant-a.web.example.com", "gcp", ingress_ip)]
+
+
+class FakeRoute53:
+    def __init__(self, record_sets):
+        self.record_sets = record_sets
+
+    def change_resource_record_sets(self, HostedZoneId, ChangeBatch):
+        # all or nothing, a deleted record set must match exactly
+        for change in ChangeBatch["Changes"]:
+            record_set = dict(change["ResourceRecordSet"], Name=change["ResourceRecordSet"]["Name"].rstrip(".") + ".")
+            if record_set not in self.record_sets:
+                raise Exception("InvalidChangeBatch: record set not found")
+        for change in ChangeBatch["Changes"]:
+            self.record_sets.remove(dict(change["ResourceRecordSet"], Name=change["ResourceRecordSet"]["Name"].rstrip(".") + "."))
+
+    def list_resource_record_sets(self, HostedZoneId, StartRecordName, StartRecordType, MaxItems):
+        return {"ResourceRecordSets": [rs for rs in self.record_sets if rs["Name"] >= StartRecordName]}
+
+
+def test_route53_batch_delete_tolerates_missing_records(monkeypatch):
+    kept = {"Name": "other.example.com.", "Type": "A", "TTL": 300, "ResourceRecords": [{"Value": "10.0.0.9"}]}
+    route53 = FakeRoute53([
+        {"Name": "a.example.com.", "Type": "A", "TTL": 60, "ResourceRecords": [{"Value": "10.0.0.1"}]},  # other TTL
+        kept,
+    ])
+    monkeypatch.setattr(dns_manager.boto3, "client", lambda service, **kwargs: route53)
+
+    dns_manager.delete_dns_records("aws", [("a.example.com", "10.0.0.1"), ("gone.example.com", "10.0.0.2")])
+    assert route53.record_sets == [kept]
+
+
+def test_gc_is_audited_with_its_scope(monkeypatch):
+    import deployment
+    from flask import Flask
+    recorded = []
+    monkeypatch.setattr(deployment.audit_log, "record", lambda action, **fields: recorded.append((action, fields)))
+
+    app = Flask(__name__)
+    with app.test_request_context("/deployment/admin/gc", method="POST", json={"cloud_provider": "gcp"}):
+        deployment.request.url_rule = type("Rule", (), {"endpoint": "deployment.garbage_collect"})()
+        response = app.response_class(json.dumps({"dry_run": False, "reports": [{"deleted": ["tenant-a/web"]}]}),
+                                      mimetype="application/json")
+        deployment.audit_request(response)
+
+    action, fields = recorded[0]
+    assert action == "gc"
+    assert fields["app_name"] is None and fields["namespace"] is None
+    assert fields["deleted"] == ["tenant-a/web"]
@@ -0,0 +1,30 @@
+import pytest
+from flask import Flask
+import deployment
+from events import broker
+
+
+@pytest.fixture
+def slots(monkeypatch):
+    monkeypatch.setattr(deployment, "_stream_slots", deployment.threading.BoundedSemaphore(2))
+
+
+def test_namespace_stream_ends_after_its_max_duration():
+    subscription = broker.subscribe("namespace:tenant-a")
+    broker.publish(["namespace:tenant-a"], "ready", namespace="tenant-a")
+    chunks = list(deployment.stream_events(subscription, until_terminal=False, max_duration=0.2))
+    assert len(chunks) == 2 and chunks[0].startswith("id:") and chunks[1] == ": keep-alive\n\n"
+
+
+def test_event_streams_are_capped(slots):
+    app = Flask(__name__)
+    with app.test_request_context("/deployment/events"):
+        responses = []
+        for _ in range(2):
+            assert deployment.acquire_stream_slot()
+            responses.append(deployment.event_stream_response(broker.subscribe("namespace:tenant-a"), until_terminal=False))
+        assert not deployment.acquire_stream_slot()
+        assert deployment.too_many_streams()[1] == 503
+
+        responses[0].close()  # the client is gone: its slot is given back
+        assert deployment.acquire_stream_slot()
@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.mark.parametrize("ttl", ["abc", None, 0, -60])
+def test_invalid_ttl_is_rejected(api, ttl):
+    response = api.post('/deployment/global-dns', json={"namespace": "tenant-a", "appname": "web", "ttl": ttl})
+    assert response.status_code == 400
+    assert response.json == {"error": "Invalid ttl"}
@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+import deploy_steps
+import jobs
+from events import broker
+from jobs import enqueue_job, claim_job, run_job, JobWatcher, MAX_JOB_ATTEMPTS
+from models import db
+
+DEPLOY_PARAMS = {"deployment_id": "d-1", "cloud_provider": "gcp", "namespace": "tenant-a", "app_name": "web",
+                 "public_url": "http://tenant-a.web.gcp.example.com"}
+UNDEPLOY_PARAMS = {"deployment_id": "d-2", "cloud_provider": "gcp", "domain": "example.com",
+                   "namespace": "tenant-a", "app_name": "web"}
+
+
+@pytest.fixture
+def dns(monkeypatch):
+    records = {"deleted": [], "routed": []}
+    monkeypatch.setattr(deploy_steps, "delete_dns_records", lambda provider, rs: records["deleted"].extend(rs))
+    monkeypatch.setattr(deploy_steps, "delete_routed_dns_endpoint", lambda *args: records["routed"].append(args))
+    return records
+
+
+def run_next(worker_id="worker-1"):
+    job = claim_job(worker_id)
+    return run_job(job, worker_id) if job else None
+
+
+def test_claim_is_exclusive(app):
+    enqueue_job("deploy", DEPLOY_PARAMS)
+    assert claim_job("worker-1") is not None
+    assert claim_job("worker-2") is None
+
+
+def test_deploy_job_runs_every_step(app, clusters):
+    job = run_next()
+    assert job is None
+
+    enqueue_job("deploy", DEPLOY_PARAMS)
+    job = run_next()
+    assert job.status == "succeeded"
+    assert job.completed_steps == ["deployment", "service", "ingress", "ip", "dns"]
+    assert job.result["ingress_ip"]
+    assert ("ingress", "tenant-a", "web") in clusters["gcp"].objects
+
+
+def test_abandoned_job_resumes_after_its_checkpoint(app, clusters, monkeypatch):
+    job = enqueue_job("deploy", DEPLOY_PARAMS)
+    claim_job("worker-1")
+
+    # worker-1 dies after the service step: the deployment and service exist, the checkpoint says so
+    jobs.create_deployment("gcp", "tenant-a", "web")
+    jobs.create_service("gcp", "tenant-a", "web")
+    job.completed_steps = ["deployment", "service"]
+    job.heartbeat_at = datetime.now(timezone.utc) - timedelta(seconds=jobs.JOB_LEASE + 1)
+    db.session.commit()
+
+    calls = []
+    monkeypatch.setattr(jobs, "create_deployment", lambda *args: calls.append("deployment"))
+    job = run_next("worker-2")
+    assert job.status == "succeeded"
+    assert job.worker_id == "worker-2"
+    assert job.attempts == 2
+    assert calls == []
+
+
+def test_steps_already_done_count_as_done(app, clusters):
+    # e.g. a worker died between creating the deployment and committing its checkpoint
+    jobs.create_deployment("gcp", "tenant-a", "web")
+    enqueue_job("deploy", DEPLOY_PARAMS)
+    assert run_next().status == "succeeded"
+
+
+def test_undeploy_deletes_the_dns_record_of_the_ingress(app, clusters, dns):
+    enqueue_job("deploy", DEPLOY_PARAMS)
+    ingress_ip = run_next().result["ingress_ip"]
+
+    enqueue_job("undeploy", UNDEPLOY_PARAMS)
+    job = run_next()
+    assert job.status == "succeeded", job.error
+    assert dns["deleted"] == [("tenant-a.web.gcp.example.com", ingress_ip)]
+    assert not clusters["gcp"].objects
+
+
+def test_undeploy_of_missing_app_succeeds(app, dns):
+    enqueue_job("undeploy", UNDEPLOY_PARAMS)
+    assert run_next().status == "succeeded"
+    assert dns["deleted"] == []
+
+
+def test_synchronous_undeploy_deletes_the_same_dns_record(app, clusters, dns):
+    enqueue_job("deploy", DEPLOY_PARAMS)
+    ingress_ip = run_next().result["ingress_ip"]
+
+    deploy_steps.run_undeploy("d-3", "gcp", "example.com", "tenant-a", "web")
+    assert dns["deleted"] == [("tenant-a.web.gcp.example.com", ingress_ip)]
+    assert not clusters["gcp"].objects
+
+
+@pytest.mark.parametrize("synchronous", [True, False])
+def test_undeploy_removes_the_cloud_from_global_hostnames(app, clusters, dns, synchronous):
+    enqueue_job("deploy", DEPLOY_PARAMS)
+    ingress_ip = run_next().result["ingress_ip"]
+    deploy_steps.add_ingress_host("gcp", "tenant-a", "web", "tenant-a.web.example.com", "aws")
+
+    if synchronous:
+        deploy_steps.run_undeploy("d-3", "gcp", "example.com", "tenant-a", "web")
+    else:
+        enqueue_job("undeploy", UNDEPLOY_PARAMS)
+        assert run_next().status == "succeeded"
+    assert dns["routed"] == [("aws", "tenant-a.web.example.com", "gcp", ingress_ip)]
+    assert dns["deleted"] == [("tenant-a.web.gcp.example.com", ingress_ip)]
+
+
+def test_synchronous_undeploy_reports_dns_failures(app, clusters, monkeypatch):
+    enqueue_job("deploy", DEPLOY_PARAMS)
+    run_next()
+
+    def fail(provider, records):
+        raise Exception("Throttling: Rate exceeded")
+    monkeypatch.setattr(deploy_steps, "delete_dns_records", fail)
+    with pytest.raises(deploy_steps.DeploymentError, match="Failed to delete DNS record"):
+        deploy_steps.run_undeploy("d-3", "gcp", "example.com", "tenant-a", "web")
+    assert ("ingress", "tenant-a", "web") in clusters["gcp"].objects  # nothing deleted, the undeploy can be retried
+
+
+def test_failed_step_is_retried_after_a_backoff(app, monkeypatch):
+    def fail(*args):
+        raise jobs.DeploymentError("Failed to create deployment: timeout")
+    monkeypatch.setitem(jobs.JOB_STEPS, "deploy", [("deployment", fail, 409)])
+
+    job = enqueue_job("deploy", DEPLOY_PARAMS)
+    for attempt in range(1, MAX_JOB_ATTEMPTS + 1):
+        run_next()
+        assert job.attempts == attempt
+        if attempt < MAX_JOB_ATTEMPTS:
+            assert job.status == "pending"
+            assert claim_job("worker-1") is None  # not due yet
+            job.not_before = datetime.now(timezone.utc) - timedelta(seconds=1)
+            db.session.commit()
+    assert job.status == "failed"
+    assert job.error == "Failed to create deployment: timeout"
+
+
+def test_watcher_publishes_job_progress(app):
+    subscription = broker.subscribe("d-1")
+    watcher = JobWatcher()
+    enqueue_job("deploy", DEPLOY_PARAMS)
+    run_next()
+    watcher.poll()
+    watcher.poll()  # already published jobs are not published again
+
+    events = []
+    while (event := subscription.get(timeout=0)) is not None:
+        events.append(event["type"])
+    subscription.close()
+    assert events == ["deployment_created", "service_created", "ingress_created", "ip_assigned", "dns_committed", "ready"]
+
+
+def test_watcher_waits_for_the_job_table(capsys):
+    from flask import Flask
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+    db.init_app(app)
+    watcher = JobWatcher()
+
+    delays = [watcher.tick(app) for _ in range(3)]
+    assert delays == [2 * jobs.JOB_WATCH_INTERVAL, 4 * jobs.JOB_WATCH_INTERVAL, 8 * jobs.JOB_WATCH_INTERVAL]
+    assert capsys.readouterr().out.count("\n") == 1  # logged once
+
+    with app.app_context():
+        db.create_all()
+    assert watcher.tick(app) == jobs.JOB_WATCH_INTERVAL
+    assert "polling jobs again" in capsys.readouterr().out
@@ -0,0 +1,39 @@
+import pytest
+from flask import Flask
+import deployment
+import placement
+from deploy_steps import create_deployment
+
+
+@pytest.fixture
+def samples():
+    for window in placement._samples.values():
+        window.clear()
+    yield placement._samples
+
+
+def test_old_samples_leave_the_window(samples, monkeypatch):
+    now = placement.time.monotonic()
+    monkeypatch.setattr(placement.time, "monotonic", lambda: now - placement.WINDOW_SECONDS - 1)
+    placement.record_step("aws", 5.0, False)  # an outage long ago
+    monkeypatch.setattr(placement.time, "monotonic", lambda: now)
+    placement.record_step("aws", 0.1, True)
+
+    assert placement.get_stats("aws") == {"samples": 1, "avg_latency": 0.1, "error_rate": 0.0}
+
+
+def resolve(cloud_provider=None, app_name="web"):
+    with Flask(__name__).test_request_context():
+        cloud_provider, error = deployment.resolve_cloud_provider(cloud_provider, "tenant-a", app_name)
+        return cloud_provider, error[1] if error else None
+
+
+def test_cloud_of_an_existing_app_is_resolved():
+    create_deployment("gcp", "tenant-a", "web")
+    assert resolve() == ("gcp", None)
+    assert resolve("azure") == ("azure", None)  # given, not checked
+    assert resolve(app_name="missing") == (None, 404)
+
+    create_deployment("azure", "tenant-a", "web")
+    assert resolve() == (None, 400)  # ambiguous
+    assert resolve("ibm") == (None, 400)
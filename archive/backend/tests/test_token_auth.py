@@ -0,0 +1,111 @@
+import json
+import time
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from flask import Flask
+from flask_jwt_extended import create_access_token
+from jwt import encode, decode, get_unverified_header, InvalidTokenError, ExpiredSignatureError
+import auth
+import token_auth
+from token_auth import KeySet, TokenVerifier, public_jwk, jwk_thumbprint
+
+SECRET = "test-secret-test-secret-test-secret"
+
+
+def make_token(exp_in=300, jti="jti-1", key=SECRET, algorithm="HS256", kid=None):
+    claims = {"sub": {"username": "alice", "role": "dev"}, "jti": jti, "type": "access", "exp": int(time.time()) + exp_in}
+    return encode(claims, key, algorithm=algorithm, headers={"kid": kid} if kid else None)
+
+
+def make_ec_key(path):
+    pem = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+    path.write_text(pem)
+    return pem
+
+
+def public_key(pem):
+    return serialization.load_pem_private_key(pem.encode(), password=None).public_key()
+
+
+def test_verified_claims_are_cached(monkeypatch):
+    verifier = TokenVerifier(secret=SECRET)
+    decoded = []
+    decode_token = verifier._decode
+    monkeypatch.setattr(verifier, "_decode", lambda token: decoded.append(token) or decode_token(token))
+
+    token = make_token()
+    assert verifier.verify(token)["sub"]["username"] == "alice"
+    assert verifier.verify(token)["jti"] == "jti-1"
+    assert len(decoded) == 1
+
+
+def test_expired_token_is_rejected_even_when_cached():
+    verifier = TokenVerifier(secret=SECRET)
+    with pytest.raises(ExpiredSignatureError):
+        verifier.verify(make_token(exp_in=-1))
+
+    token = make_token(exp_in=1)
+    verifier.verify(token)
+    time.sleep(1.5)
+    with pytest.raises(ExpiredSignatureError):
+        verifier.verify(token)
+
+
+def test_revoked_token_is_rejected():
+    blocklist = set()
+    verifier = TokenVerifier(secret=SECRET, is_revoked=lambda jti: jti in blocklist)
+    token, other = make_token(jti="jti-1"), make_token(jti="jti-2")
+    verifier.verify(token)
+
+    verifier.revoke("jti-1")  # logout in this process
+    with pytest.raises(InvalidTokenError, match="revoked"):
+        verifier.verify(token)
+
+    blocklist.add("jti-2")  # logout in another process, seen on the first check of the token
+    with pytest.raises(InvalidTokenError, match="revoked"):
+        verifier.verify(other)
+
+
+def test_unknown_kid_refreshes_the_key_set(tmp_path, monkeypatch):
+    monkeypatch.setattr(token_auth, "JWKS_MIN_REFRESH", 0)
+    jwks_file = tmp_path / "jwks.json"
+
+    def publish(*pems):
+        keys = [{**public_jwk(pem), "kid": jwk_thumbprint(public_jwk(pem))} for pem in pems]
+        jwks_file.write_text(json.dumps({"keys": keys}))
+    old, new = make_ec_key(tmp_path / "old.pem"), make_ec_key(tmp_path / "new.pem")
+    publish(old)
+    verifier = TokenVerifier("ES256", key_set=KeySet(jwks_file=str(jwks_file)))
+    verifier.verify(make_token(key=old, algorithm="ES256", kid=jwk_thumbprint(public_jwk(old))))
+
+    publish(old, new)  # rotation: the new key is published
+    new_token = make_token(jti="jti-2", key=new, algorithm="ES256", kid=jwk_thumbprint(public_jwk(new)))
+    assert verifier.verify(new_token)["jti"] == "jti-2"
+    with pytest.raises(InvalidTokenError, match="Unknown key id"):
+        verifier.verify(make_token(jti="jti-3", key=new, algorithm="ES256", kid="unknown"))
+
+
+def test_replacing_the_key_file_rotates_the_kid(tmp_path):
+    key_file = tmp_path / "signing.pem"
+    jwks_file = tmp_path / "jwks.json"
+    app = Flask(__name__)
+    app.config.update(JWT_ALGORITHM="ES256", JWT_PRIVATE_KEY_FILE=str(key_file), JWT_JWKS_FILE=str(jwks_file),
+                      JWT_SECRET_KEY=SECRET)
+    auth.init_token_auth(app)
+
+    kids = []
+    for version in range(2):
+        pem = make_ec_key(key_file)
+        jwks_file.write_text(json.dumps({"keys": [{**public_jwk(pem), "kid": jwk_thumbprint(public_jwk(pem))}]}))
+        with app.app_context():
+            token = create_access_token(identity={"username": "alice", "role": "dev"})
+        kids.append(get_unverified_header(token)["kid"])
+        assert kids[-1] == jwk_thumbprint(public_jwk(pem))
+        decode(token, public_key(pem), algorithms=["ES256"], options={"verify_sub": False})
+    assert kids[0] != kids[1]
+
+    (tmp_path / "signing.pem.kid").write_text("2026-10\n")
+    with app.app_context():
+        assert get_unverified_header(create_access_token(identity={"username": "alice"}))["kid"] == "2026-10"
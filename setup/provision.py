@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+#
+# Provision the multi-cloud-multi-tenant platform (Python replacement of deploy_multicloud.sh).
+#
+# Independent steps run concurrently: the backend and frontend images are built and pushed in
+# parallel with the Terraform apply, and the per-cloud setup (CSI driver, secret provider,
+# components, DNS record) runs on every cluster at the same time. DNS records are upserted with
+# the backend's DNS driver instead of list/delete/create. What was already provisioned (Terraform
+# configuration, pushed images, CSI driver version, DNS records) is cached in a state file and
+# skipped on the next run.
+#
+#   ./provision.py v1.0.0 v1.2.3 ~/workspace/multi-cloud-multi-tenant <BACKEND_RELEASE_URL> <FRONTEND_RELEASE_URL> --clouds gcp aws
+#   ./provision.py ... --dry-run     # print the plan, without calling any tool or cloud API
+#
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+SETUP_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_SRC = os.path.join(SETUP_DIR, "..", "archive", "backend", "src")
+sys.path.insert(0, BACKEND_SRC)  # the backend's Kubernetes and DNS drivers are imported lazily, when used
+
+CLOUDS = ["aws", "gcp", "azure"]
+CSI_DRIVER_VERSION = "v1.3.4"
+CSI_DRIVER_MANIFESTS = ["rbac-secretproviderclass", "csidriver", "secrets-store.csi.x-k8s.io_secretproviderclasses",
+                        "secrets-store.csi.x-k8s.io_secretproviderclasspodstatuses", "secrets-store-csi-driver"]
+GCP_PROVIDER_MANIFEST = "https://raw.githubusercontent.com/GoogleCloudPlatform/secrets-store-csi-driver-provider-gcp/main/deploy/provider-gcp-plugin.yaml"
+COMPONENT_FILES = ["configMap", "deployment", "service", "ingress"]
+DNS_TTL = 300
+# Default DNS zone of each provider: a managed zone name (gcp), a hosted zone id (aws), a zone name,
+# i.e. the domain (azure). None: the zone must be given.
+DNS_ZONE_DEFAULTS = {
+    "gcp": lambda args: os.getenv("GCP_DNS_ZONE_NAME", "backend-zone"),
+    "aws": lambda args: os.getenv("AWS_HOSTED_ZONE_ID"),
+    "azure": lambda args: os.getenv("AZURE_DNS_ZONE_NAME", args.domain),
+}
+
+
+class Provisioner:
+    def __init__(self, args):
+        self.args = args
+        self.dry_run = args.dry_run
+        self.state_file = args.state_file
+        self.state = {} if args.refresh else self._load_state()
+        self._lock = threading.Lock()
+
+    # ---- helpers
+
+    def _load_state(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        if self.dry_run:
+            return
+        with self._lock:
+            with open(self.state_file, "w") as f:
+                json.dump(self.state, f, indent=2, sort_keys=True)
+
+    def _set_state(self, value, *path):
+        with self._lock:
+            node = self.state
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = value
+        self._save_state()
+
+    def _get_state(self, *path):
+        node = self.state
+        for key in path:
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return node
+
+    def log(self, scope, message):
+        with self._lock:
+            print(f"[{scope}] {message}", flush=True)
+
+    # Run a command, or print it in dry-run mode
+    def run(self, scope, command, cwd=None, capture=False):
+        self.log(scope, ("(dry-run) " if self.dry_run else "") + " ".join(command))
+        if self.dry_run:
+            return ""
+        result = subprocess.run(command, cwd=cwd, check=True, text=True,
+                                stdout=subprocess.PIPE if capture else None)
+        return result.stdout.strip() if capture else ""
+
+    def kubectl(self, cloud, *args, capture=False):
+        return self.run(cloud, ["kubectl", "--context", cloud, *args], cwd=SETUP_DIR, capture=capture)
+
+    # ---- global steps
+
+    def terraform(self):
+        tf_hash = hashlib.sha256()
+        for name in sorted(os.listdir(SETUP_DIR)):
+            if name.endswith(".tf"):
+                with open(os.path.join(SETUP_DIR, name), "rb") as f:
+                    tf_hash.update(f.read())
+        if self._get_state("terraform") == tf_hash.hexdigest():
+            self.log("terraform", "configuration unchanged, skipped")
+            return
+        self.run("terraform", ["terraform", "init", "-input=false"], cwd=SETUP_DIR)
+        self.run("terraform", ["terraform", "apply", "-auto-approve", "-input=false"], cwd=SETUP_DIR)
+        self._set_state(tf_hash.hexdigest(), "terraform")
+
+    def configure_docker(self):
+        if self._get_state("docker_configured"):
+            return
+        self.run("docker", ["gcloud", "auth", "configure-docker", "--quiet"])
+        self._set_state(True, "docker_configured")
+
+    def build_and_push(self, component, version, release):
+        image = f"gcr.io/{self.args.project_id}/{component}:{version}"
+        if self._get_state("images", image):
+            self.log(component, f"{image} already pushed, skipped")
+            return image
+
+        self.log(component, f"building {image} from {release}")
+        if not self.dry_run:
+            work_dir = tempfile.mkdtemp(prefix=f"{component}-")
+            try:
+                zip_file = os.path.join(work_dir, os.path.basename(release))
+                urllib.request.urlretrieve(release, zip_file)
+                with zipfile.ZipFile(zip_file) as archive:
+                    archive.extractall(work_dir)
+                    source_dir = os.path.join(work_dir, archive.namelist()[0].split("/")[0])
+                self.run(component, ["docker", "build", "-t", image, "."], cwd=source_dir)
+                self.run(component, ["docker", "push", image])
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        self._set_state(True, "images", image)
+        return image
+
+    def ensure_gcp_dns_zone(self):
+        zone = self.args.dns_zone
+        if self._get_state("dns_zones", zone):
+            self.log("dns", f"managed zone {zone} exists, skipped")
+            return
+        exists = False
+        if not self.dry_run:
+            exists = subprocess.run(["gcloud", "dns", "managed-zones", "describe", zone, f"--project={self.args.project_id}"],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+        if not exists:
+            self.run("dns", ["gcloud", "dns", "managed-zones", "create", zone, f"--dns-name={self.args.domain}.",
+                             "--description=Managed zone for backend services", "--visibility=public",
+                             f"--project={self.args.project_id}"])
+        self._set_state(True, "dns_zones", zone)
+
+    # ---- per-cloud steps
+
+    def install_csi_driver(self, cloud):
+        if self._get_state("clouds", cloud, "csi_driver") == CSI_DRIVER_VERSION:
+            self.log(cloud, f"Secrets Store CSI driver {CSI_DRIVER_VERSION} already installed, skipped")
+            return
+        base = f"https://raw.githubusercontent.com/kubernetes-sigs/secrets-store-csi-driver/{CSI_DRIVER_VERSION}/deploy"
+        args = []
+        for manifest in CSI_DRIVER_MANIFESTS:
+            args += ["-f", f"{base}/{manifest}.yaml"]
+        self.kubectl(cloud, "apply", *args, "-f", GCP_PROVIDER_MANIFEST)
+        self._set_state(CSI_DRIVER_VERSION, "clouds", cloud, "csi_driver")
+
+    def deploy_component(self, cloud, component):
+        files = [os.path.join(self.args.manifests_dir, f"{component}-{name}.yaml") for name in COMPONENT_FILES]
+        args = []
+        for path in files:
+            if os.path.exists(path):
+                args += ["-f", path]
+        if args:
+            self.kubectl(cloud, "apply", *args)
+
+    def backend_ip(self, cloud):
+        if self.dry_run:
+            return "<backend-ip>"
+        from kubernetes import client
+        from utils import get_api_client
+        deadline = time.monotonic() + self.args.timeout
+        while True:
+            service = client.CoreV1Api(api_client=get_api_client(cloud)).read_namespaced_service("backend-service", "default")
+            ingress = service.status.load_balancer.ingress
+            if ingress and ingress[0].ip:
+                return ingress[0].ip
+            if time.monotonic() > deadline:
+                raise RuntimeError("backend-service has no external IP")
+            time.sleep(5)
+
+    def upsert_backend_dns_record(self, cloud):
+        dns_name = f"api.{cloud}.{self.args.domain}." if len(self.args.clouds) > 1 else f"api.{self.args.domain}."
+        ip = self.backend_ip(cloud)
+        if self._get_state("clouds", cloud, "dns", dns_name) == ip:
+            self.log(cloud, f"{dns_name} -> {ip} unchanged, skipped")
+            return
+        self.log(cloud, ("(dry-run) " if self.dry_run else "") + f"upsert {dns_name} A {ip} in zone {self.args.dns_zone} ({self.args.dns_provider})")
+        if not self.dry_run:
+            from dns_manager import upsert_dns_record
+            upsert_dns_record(self.args.dns_provider, dns_name, ip, ttl=DNS_TTL, zone=self.args.dns_zone,
+                              project=self.args.project_id)
+        self._set_state(ip, "clouds", cloud, "dns", dns_name)
+
+    def setup_cloud(self, cloud):
+        self.install_csi_driver(cloud)
+        self.kubectl(cloud, "apply", "-f", os.path.join(SETUP_DIR, "..", "gcp-secret-provider-class.yaml"))
+        self.deploy_component(cloud, "backend")
+        self.kubectl(cloud, "wait", "--for=condition=available", f"--timeout={self.args.timeout}s", "deployment/nginx-backend")
+        self.upsert_backend_dns_record(cloud)
+        self.deploy_component(cloud, "frontend")
+        self.log(cloud, "done")
+
+    # ---- plan
+
+    def provision(self):
+        start = time.monotonic()
+        self.configure_docker()
+        with ThreadPoolExecutor(max_workers=4 + len(self.args.clouds)) as executor:
+            # Infrastructure and images are independent of each other
+            global_steps = [
+                executor.submit(self.terraform),
+                executor.submit(self.build_and_push, "nginx-backend", self.args.backend_version, self.args.backend_release),
+                executor.submit(self.build_and_push, "nginx-frontend", self.args.frontend_version, self.args.frontend_release),
+            ]
+            if self.args.dns_provider == "gcp":
+                global_steps.append(executor.submit(self.ensure_gcp_dns_zone))
+            for step in global_steps:
+                step.result()
+
+            # Then every cluster is set up at the same time
+            cloud_steps = {cloud: executor.submit(self.setup_cloud, cloud) for cloud in self.args.clouds}
+            failed = []
+            for cloud, step in cloud_steps.items():
+                try:
+                    step.result()
+                except Exception as e:
+                    self.log(cloud, f"failed: {e}")
+                    failed.append(cloud)
+
+        self.log("provision", f"finished in {time.monotonic() - start:.0f}s" + (f", failed on {', '.join(failed)}" if failed else ""))
+        return 1 if failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Provision the multi-cloud-multi-tenant platform")
+    parser.add_argument("backend_version", help="e.g. v1.0.0")
+    parser.add_argument("frontend_version", help="e.g. v1.2.3")
+    parser.add_argument("project_dir", help="e.g. ~/workspace/multi-cloud-multi-tenant")
+    parser.add_argument("backend_release", help="e.g. https://github.com/dbd311/backend-multicloud/archive/refs/tags/v1.0.0.zip")
+    parser.add_argument("frontend_release", help="e.g. https://github.com/dbd311/frontend-multicloud/archive/refs/tags/v1.0.0.zip")
+    parser.add_argument("--clouds", nargs="+", choices=CLOUDS, default=["gcp"], help="kube contexts to set up")
+    parser.add_argument("--project-id", default=os.getenv("PROJECT_ID", "multicloudplatform"))
+    parser.add_argument("--domain", default=os.getenv("DOMAIN_NAME", "multicloudplatform.com"))
+    parser.add_argument("--dns-provider", choices=CLOUDS, default="gcp", help="cloud hosting the DNS zone")
+    parser.add_argument("--dns-zone", help="gcp: managed zone name (default: $GCP_DNS_ZONE_NAME or backend-zone), "
+                                           "aws: hosted zone id (default: $AWS_HOSTED_ZONE_ID), "
+                                           "azure: zone name (default: $AZURE_DNS_ZONE_NAME or the domain)")
+    parser.add_argument("--manifests-dir", help="directory of the <component>-*.yaml files (default: <project_dir>/setup)")
+    parser.add_argument("--state-file", default=os.path.join(SETUP_DIR, ".provision-state.json"))
+    parser.add_argument("--refresh", action="store_true", help="ignore the cached state")
+    parser.add_argument("--timeout", type=int, default=300, help="seconds to wait for the backend")
+    parser.add_argument("--dry-run", action="store_true", help="print the steps without running them")
+    args = parser.parse_args(argv)
+    args.project_dir = os.path.expanduser(args.project_dir)
+    args.manifests_dir = args.manifests_dir or os.path.join(args.project_dir, "setup")
+
+    args.dns_zone = args.dns_zone or DNS_ZONE_DEFAULTS[args.dns_provider](args)
+    if not args.dns_zone:
+        parser.error(f"--dns-zone is required with --dns-provider {args.dns_provider}")
+    if args.dns_provider == "aws" and not re.match(r"^(/hostedzone/)?Z[A-Z0-9]+$", args.dns_zone):
+        parser.error(f"--dns-zone {args.dns_zone} is not a Route53 hosted zone id (e.g. Z0123456789ABC)")
+    domain, zone = args.domain.rstrip("."), args.dns_zone.rstrip(".")
+    if args.dns_provider == "azure" and not (domain == zone or domain.endswith(f".{zone}")):
+        parser.error(f"--domain {args.domain} is not in the Azure DNS zone {args.dns_zone}")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(Provisioner(parse_args()).provision())
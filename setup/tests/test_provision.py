@@ -0,0 +1,89 @@
+#
+# Offline tests of the provisioner: dry runs only, no tool or cloud API is called.
+#
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import provision
+from provision import Provisioner, parse_args
+
+RELEASES = ["v1.0.0", "v1.2.3", "~/workspace/multi-cloud-multi-tenant",
+            "https://example.com/backend.zip", "https://example.com/frontend.zip"]
+
+
+@pytest.fixture(autouse=True)
+def no_commands(monkeypatch):
+    def run(*args, **kwargs):
+        raise AssertionError(f"command run in dry-run mode: {args}")
+    monkeypatch.setattr(subprocess, "run", run)
+    monkeypatch.setattr(provision.urllib.request, "urlretrieve", run)
+
+
+def test_dry_run_prints_the_plan_and_saves_nothing(tmp_path, capsys):
+    state_file = tmp_path / "state.json"
+    args = parse_args([*RELEASES, "--clouds", "gcp", "aws", "--project-id", "acme", "--domain", "acme.io",
+                       "--state-file", str(state_file), "--dry-run"])
+    assert Provisioner(args).provision() == 0
+
+    out = capsys.readouterr().out
+    for planned in [
+        "[docker] (dry-run) gcloud auth configure-docker --quiet",
+        "[terraform] (dry-run) terraform apply -auto-approve -input=false",
+        "[nginx-backend] building gcr.io/acme/nginx-backend:v1.0.0 from https://example.com/backend.zip",
+        "[dns] (dry-run) gcloud dns managed-zones create backend-zone --dns-name=acme.io.",
+        "[aws] (dry-run) kubectl --context aws apply -f https://raw.githubusercontent.com/kubernetes-sigs/secrets-store-csi-driver/",
+        "[gcp] (dry-run) kubectl --context gcp wait --for=condition=available --timeout=300s deployment/nginx-backend",
+        "[gcp] (dry-run) upsert api.gcp.acme.io. A <backend-ip> in zone backend-zone (gcp)",
+        "[aws] (dry-run) upsert api.aws.acme.io. A <backend-ip> in zone backend-zone (gcp)",
+        "[aws] done",
+    ]:
+        assert planned in out
+    assert "failed" not in out
+    assert not state_file.exists()
+
+
+def test_dry_run_skips_what_the_state_says_is_done(tmp_path, capsys):
+    state_file = tmp_path / "state.json"
+    state = {"images": {"gcr.io/acme/nginx-backend:v1.0.0": True},
+             "clouds": {"gcp": {"csi_driver": provision.CSI_DRIVER_VERSION}}}
+    state_file.write_text(json.dumps(state))
+    args = parse_args([*RELEASES, "--project-id", "acme", "--state-file", str(state_file), "--dry-run"])
+    assert Provisioner(args).provision() == 0
+
+    out = capsys.readouterr().out
+    assert "gcr.io/acme/nginx-backend:v1.0.0 already pushed, skipped" in out
+    assert f"Secrets Store CSI driver {provision.CSI_DRIVER_VERSION} already installed, skipped" in out
+    assert json.loads(state_file.read_text()) == state
+
+
+@pytest.mark.parametrize("options, zone", [
+    (["--dns-provider", "gcp"], "backend-zone"),
+    (["--dns-provider", "aws", "--dns-zone", "Z0123456789ABC"], "Z0123456789ABC"),
+    (["--dns-provider", "aws", "--dns-zone", "/hostedzone/Z0123456789ABC"], "/hostedzone/Z0123456789ABC"),
+    (["--dns-provider", "azure", "--domain", "api.acme.io", "--dns-zone", "acme.io"], "acme.io"),
+    (["--dns-provider", "azure", "--domain", "acme.io"], "acme.io"),
+])
+def test_dns_zone_defaults_and_valid_zones(monkeypatch, options, zone):
+    for name in ("GCP_DNS_ZONE_NAME", "AWS_HOSTED_ZONE_ID", "AZURE_DNS_ZONE_NAME"):
+        monkeypatch.delenv(name, raising=False)
+    assert parse_args([*RELEASES, *options]).dns_zone == zone
+
+
+@pytest.mark.parametrize("options", [
+    ["--dns-provider", "aws"],  # no default hosted zone id
+    ["--dns-provider", "aws", "--dns-zone", "acme.io"],  # a domain, not a hosted zone id
+    ["--dns-provider", "azure", "--domain", "acme.io", "--dns-zone", "other.io"],
+    ["--dns-provider", "azure", "--domain", "notacme.io", "--dns-zone", "acme.io"],
+])
+def test_invalid_dns_zones_are_rejected(monkeypatch, capsys, options):
+    monkeypatch.delenv("AWS_HOSTED_ZONE_ID", raising=False)
+    with pytest.raises(SystemExit) as exit:
+        parse_args([*RELEASES, *options])
+    assert exit.value.code == 2
+    err = capsys.readouterr().err
+    assert "--dns-zone" in err or "--domain" in err